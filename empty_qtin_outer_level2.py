@@ -1,153 +1,158 @@
+import logging
+import numpy as np
 import pandas as pd
-import shutil
-from openpyxl import load_workbook
 from datetime import datetime
 
+from specification_io import TemplateCache, configure_logging, stream_sheet
+
+# Вывод логов настраивает вызывающий код, при запуске скриптом - specification_io.configure_logging
+logger = logging.getLogger(__name__)
+
 
 class SpecificationGenerator:
 
+    # Колонки выходного файла в порядке записи
+    OUTPUT_COLUMNS = [
+        'productNameRus', 'productNameEng', 'identificationCode',
+        'identificationCodeOuter', 'identificationCodeCase', 'identificationCodePallet',
+        'invoiceNo', 'invoiceDate', 'TotalAmount'
+    ]
+    # Первая строка данных на листе шаблона: шапка занимает строки 1-10
+    OUTPUT_START_ROW = 11
+
+    # Колонки, которые читаем из входных файлов; остальные не разбираем
+    MASTER_FILE_COLUMNS = ['SKU', 'GTIN', 'GTIN Outer', 'GTIN Case', 'SIZE5', 'SIZE2']
+    FORT_QR_COLUMNS = ['GTIN', 'productNameRus', 'productNameEng', 'identificationCode']
+
     def __init__(self, master_file_path, fort_qr_path, template_path):
         self.master_file_path = master_file_path
         self.fort_qr_path = fort_qr_path
         self.template_path = template_path
-        self.output_df = pd.DataFrame(columns=[
-            'productNameRus',
-            'productNameEng',
-            'identificationCode',
-            'identificationCodeOuter',
-            'identificationCodeCase',
-            'identificationCodePallet',
-            'invoiceNo',
-            'invoiceDate',
-            'TotalAmount'
-        ])
+        self.output_df = pd.DataFrame(columns=self.OUTPUT_COLUMNS)
+        # Содержимое шаблона читаем с диска один раз и переиспользуем при каждом сохранении
+        self._template = TemplateCache(template_path)
         self.new_filename = None
 
     def load_data(self):
         # Читаем данные из XLSX файлов
         # Для Мастер файла: заголовки в 1-й строке (индекс 0), данные со 2-й (индекс 1)
-        master_file = pd.read_excel(self.master_file_path, sheet_name=0, header=0)
+        master_file = stream_sheet(self.master_file_path, header_row=0, columns=self.MASTER_FILE_COLUMNS)
         # Ограничиваем master_file до строк, где SIZE5 не пустой или пустой GTIN Outer
         master_file = master_file[master_file['SIZE5'].notna()  | master_file['GTIN Outer'].isna()]
 
         # Для FORT_QR: заголовки в 7-й строке (индекс 6), данные с 11-й (индекс 10)
-        fort_qr = pd.read_excel(self.fort_qr_path, sheet_name=0, header=6, skiprows=range(7, 10))
+        fort_qr = stream_sheet(self.fort_qr_path, header_row=6, columns=self.FORT_QR_COLUMNS,
+                              skip_rows=range(7, 10))
+
+        gtin_columns = [(master_file, column) for column in ('GTIN', 'GTIN Outer', 'GTIN Case')
+                        if column in master_file.columns]
+        gtin_columns.append((fort_qr, 'GTIN'))
+
+        # Преобразуем GTIN коды в строки одним векторным приведением: nullable Int64 сохраняет
+        # пустые значения (pd.NA) и убирает дробную часть, которую Excel дает числовым ячейкам
+        for df, column in gtin_columns:
+            df[column] = pd.to_numeric(df[column]).astype('Int64').astype('string')
 
-        # Преобразуем GTIN и GTIN Outer в строки, если они не пустые
-        master_file['GTIN'] = master_file['GTIN'].apply(lambda x: str(int(x)) if pd.notna(x) else x)
-        master_file['GTIN Outer'] = master_file['GTIN Outer'].apply(lambda x: str(int(x)) if pd.notna(x) else x)
-        fort_qr['GTIN'] = fort_qr['GTIN'].apply(lambda x: str(int(x)) if pd.notna(x) else x)
+        # Переводим GTIN коды в category с общим набором категорий: isin, сравнения и merge
+        # работают с целочисленными кодами категорий вместо сравнения строк
+        categories = pd.Index(pd.unique(pd.concat([df[column] for df, column in gtin_columns]).dropna()))
+        for df, column in gtin_columns:
+            df[column] = pd.Categorical(df[column], categories=categories)
 
         return master_file, fort_qr
 
     def process_data(self, master_file, fort_qr):
-        # 1. Создаем список для поиска: берем GTIN Outer, если он есть, иначе GTIN
-        search_gtins = master_file.apply(
-            lambda row: row['GTIN Outer'] if pd.notna(row['GTIN Outer']) and str(row['GTIN Outer']).strip() != ''
-            else row['GTIN'],
-            axis=1
+        # 1. Определяем GTIN коробки: GTIN Outer, если он есть, иначе GTIN (пачка сама считается коробкой)
+        master = master_file.reset_index(drop=True)
+        gtin_outer_str = master['GTIN Outer'].astype(str).str.strip()
+        use_gtin_as_outer = master['GTIN Outer'].isna() | gtin_outer_str.isin(['', 'nan'])
+        box_gtin = master['GTIN Outer'].where(~use_gtin_as_outer, master['GTIN'])
+
+        # Находим все совпадения в FORT_QR; множество GTIN строим один раз, маску используем и ниже
+        box_gtin_set = set(box_gtin.dropna())
+        box_gtin_mask = fort_qr['GTIN'].isin(box_gtin_set)
+
+        # 2. Считаем количество совпадений суммой по маске, без выборки строк
+        outer_count = int(box_gtin_mask.sum())
+        logger.info("Найдено совпадений GTIN Outer: %s", outer_count)
+
+        # 3. Векторная раскладка пачек по коробкам вместо итерации по мастер файлу
+        for sku in master.loc[use_gtin_as_outer, 'SKU']:
+            logger.info("Информация: у SKU %s отсутствует GTIN Outer - используем GTIN как коробку", str(sku).strip())
+
+        # Размеры упаковок как в _get_package_size_columns соседнего gtin_outer_case_level3: текстовые
+        # ячейки приводим к числу, дробную часть отбрасываем (как int()), пустое значение - бесконечность
+        sizes = np.trunc(master[['SIZE5', 'SIZE2']].apply(pd.to_numeric))
+        box_size = sizes['SIZE5'].where(~use_gtin_as_outer, sizes['SIZE2']).fillna(np.inf)
+
+        # Количество пачек и кодов коробок по каждому GTIN - один проход по FORT_QR
+        # (map по category может вернуть category, поэтому сначала приводим к float)
+        codes_per_gtin = fort_qr.groupby('GTIN', observed=True).size()
+        pack_count = master['GTIN'].map(codes_per_gtin).astype(float).fillna(0).astype(int)
+        outer_code_count = box_gtin.map(codes_per_gtin).astype(float).fillna(0).astype(int)
+
+        # 4. Проверяем распределение сразу по всем строкам мастер файла
+        remainder = pack_count % box_size
+        full_chunks = pack_count // box_size
+        bad_remainder = remainder > 0
+        bad_outer = ~use_gtin_as_outer & (outer_code_count > 0) & (outer_code_count < full_chunks)
+        bad_rows = bad_remainder | bad_outer
+        if bad_rows.any():
+            i = bad_rows.idxmax()
+            if bad_remainder[i]:
+                size = int(box_size[i]) if box_size[i] != float('inf') else box_size[i]
+                error_msg = (f"Ошибка распределения для GTIN Outer {box_gtin[i]}: "
+                             f"{pack_count[i]} пачек не могут быть равномерно распределены "
+                             f"в коробки по {size} пачек. Остаток: {int(remainder[i])} пачек.")
+            else:
+                # Последняя коробка строки получает код с индексом full_chunks - 1 (с нуля)
+                error_msg = (f"Индекс коробки {int(full_chunks[i]) - 1} превышает количество найденных "
+                             f"кодов коробок ({outer_code_count[i]}) для GTIN Outer: {box_gtin[i]}")
+            raise ValueError(error_msg)
+
+        # 5. Присоединяем пачки к строкам мастер файла; порядок - как у мастер файла, внутри - как в FORT_QR.
+        #    Строки без GTIN отбрасываем: merge сопоставил бы пустые ключи друг с другом
+        pack_columns = ['GTIN', 'productNameRus', 'productNameEng', 'identificationCode']
+        packs = (
+            master[['GTIN']]
+            .assign(_master_row=master.index, _box_gtin=box_gtin, _box_size=box_size,
+                    _use_gtin_as_outer=use_gtin_as_outer)
+            .dropna(subset=['GTIN'])
+            .merge(fort_qr[pack_columns].assign(_fort_row=range(len(fort_qr))).dropna(subset=['GTIN']),
+                   on='GTIN', how='inner')
+            .sort_values(['_master_row', '_fort_row'], kind='stable', ignore_index=True)
         )
 
-        # Находим все совпадения в FORT_QR
-        outer_matches = fort_qr[fort_qr['GTIN'].isin(search_gtins)]
-
-        # 2. Считаем количество совпадений
-        outer_count = len(outer_matches)
-        print(f"Найдено совпадений GTIN Outer: {outer_count}")
-
-        # 3. Итерация по мастер файлу
-        row_index = 0
-
-        for _, master_row in master_file.iterrows():
-            current_gtin_outer = master_row['GTIN Outer']
-            current_sku = str(master_row['SKU']).strip()
-
-            print(f"\nОбработка GTIN: {master_row['GTIN']}")
-
-            # Проверка на пустой GTIN Outer и определение, какой GTIN использовать
-            use_gtin_as_outer = False
-            if pd.isna(current_gtin_outer) or str(current_gtin_outer).strip() == '' or str(current_gtin_outer) == 'nan':
-                print(f"Информация: у SKU {current_sku} отсутствует GTIN Outer - используем GTIN как коробку")
-                current_gtin_outer = master_row['GTIN']
-                use_gtin_as_outer = True
-
-            # Находим все строки с соответствующим GTIN
-            pack_rows = fort_qr[fort_qr['GTIN'] == master_row['GTIN']]
-
-            if not use_gtin_as_outer:
-                # Ограничиваем количество строк согласно SIZE5
-                size = int(master_row['SIZE5']) if pd.notna(master_row['SIZE5']) else float('inf')
-
-                # Рассчитываем количество полных порций
-                total_rows = len(pack_rows)
-                full_chunks = total_rows // size
-                remainder = total_rows % size
-
-                print(
-                    f"Всего пачек: {total_rows}, размер коробки (SIZE5): {size}, "
-                    f"полных коробок: {full_chunks}, остаток пачек: {remainder}"
-                )
-                # Проверяем наличие остатка
-                if remainder > 0:
-                    error_msg = (f"Ошибка распределения для GTIN Outer {current_gtin_outer}: "
-                                 f"{total_rows} пачек не могут быть равномерно распределены "
-                                 f"в коробки по {size} пачек. Остаток: {remainder} пачек.")
-                    raise ValueError(error_msg)
-            else:
-                total_rows = len(pack_rows)
-                if total_rows > 0:
-                    size = int(master_row['SIZE2']) if pd.notna(master_row['SIZE2']) else float('inf')
-                    full_chunks = total_rows // size
-                    remainder = total_rows % size
-
-                    print(
-                        f"Всего пачек: {total_rows}, размер коробки (SIZE2): {size}, "
-                        f"полных коробок: {full_chunks}, остаток пачек: {remainder}"
-                    )
-                    # Проверяем наличие остатка
-                    if remainder > 0:
-                        error_msg = (f"Ошибка распределения для GTIN Outer {current_gtin_outer}: "
-                                     f"{total_rows} пачек не могут быть равномерно распределены "
-                                     f"в коробки по {size} пачек. Остаток: {remainder} пачек.")
-                        raise ValueError(error_msg)
-                else:
-                    full_chunks = 0
-
-
-            # Обрабатываем полные порции
-            for chunk_num in range(full_chunks):
-                start_idx = chunk_num * size
-                end_idx = (chunk_num + 1) * size
-                chunk = pack_rows.iloc[start_idx:end_idx]
-
-                # Получаем identificationCodeOuter для текущего GTIN Outer
-                outer_rows = fort_qr[fort_qr['GTIN'] == current_gtin_outer]
-
-                if use_gtin_as_outer:
-                    # Если используем GTIN как Outer, берем тот же код что и у пачки
-                    identification_outer = chunk['identificationCode'].iloc[0] if not chunk.empty else None
-                else:
-                    # Обычная логика для отдельного GTIN Outer
-                    identification_outer = outer_rows['identificationCode'].iloc[
-                        chunk_num] if not outer_rows.empty else None
-
-                for _, pack_row in chunk.iterrows():
-                    self.output_df.loc[row_index] = {
-                        'productNameRus': pack_row['productNameRus'],
-                        'productNameEng': pack_row['productNameEng'],
-                        'identificationCode': pack_row['identificationCode'],
-                        'identificationCodeOuter': identification_outer,
-                        'identificationCodeCase': None,
-                        'identificationCodePallet': None,
-                        'invoiceNo': None,
-                        'invoiceDate': None,
-                        'TotalAmount': None
-                    }
-                    row_index += 1
-
-            print(f"Обработано строк для GTIN Outer {master_row['GTIN Outer']}: {row_index}")
-
-        return row_index
+        # Номер коробки внутри строки мастер файла; после проверки все размеры конечны
+        packs['_box'] = packs.groupby('_master_row').cumcount() // packs['_box_size'].astype('int64')
+
+        # 6. Код коробки: N-я коробка получает N-й код GTIN Outer из FORT_QR (только совпавшие строки)
+        outer_codes = fort_qr.loc[box_gtin_mask, ['GTIN', 'identificationCode']].rename(
+            columns={'GTIN': '_box_gtin', 'identificationCode': 'identificationCodeOuter'}
+        )
+        outer_codes['_box'] = outer_codes.groupby('_box_gtin', observed=True).cumcount()
+        packs = packs.merge(outer_codes, on=['_box_gtin', '_box'], how='left')
+
+        # Если используем GTIN как Outer, берем код первой пачки коробки
+        first_pack_code = packs.groupby(['_master_row', '_box'])['identificationCode'].transform('first')
+        identification_outer = packs['identificationCodeOuter'].where(~packs['_use_gtin_as_outer'], first_pack_code)
+
+        self.output_df = pd.DataFrame({
+            'productNameRus': packs['productNameRus'].to_numpy(),
+            'productNameEng': packs['productNameEng'].to_numpy(),
+            'identificationCode': packs['identificationCode'].to_numpy(),
+            'identificationCodeOuter': identification_outer.astype(object).where(identification_outer.notna(), None),
+            'identificationCodeCase': None,
+            'identificationCodePallet': None,
+            'invoiceNo': None,
+            'invoiceDate': None,
+            'TotalAmount': None
+        }, columns=self.OUTPUT_COLUMNS)
+
+        # Число обработанных строк выводит save_to_excel; здесь - только итог по коробкам
+        logger.info("Всего коробок: %s", int(full_chunks.sum()))
+
+        return len(self.output_df)
 
     # def process_data(self, master_file, fort_qr):
     #     # 1. Находим все GTIN Outer из мастер файла в FORT_QR
@@ -228,38 +233,29 @@ class SpecificationGenerator:
         # Генерируем уникальное имя для нового файла с временной меткой
         self.new_filename = self.new_specification_file()
 
-        # Загружаем новый файл для записи данных
-        wb = load_workbook(self.new_filename)
+        # Открываем шаблон из памяти: копия файла на диске и повторное чтение не нужны
+        wb = self._template.open()
         ws = wb['Invoice specification']
 
-        # Записываем новые данные, начиная с 11-й строки (индекс 10 в Python)
-        for index, row in self.output_df.iterrows():
-            excel_row = 11 + index
-            ws.cell(row=excel_row, column=1, value=row['productNameRus'])
-            ws.cell(row=excel_row, column=2, value=row['productNameEng'])
-            ws.cell(row=excel_row, column=3, value=row['identificationCode'])
-            ws.cell(row=excel_row, column=4, value=row['identificationCodeOuter'])
-            ws.cell(row=excel_row, column=5, value=row['identificationCodeCase'])
-            ws.cell(row=excel_row, column=6, value=row['identificationCodePallet'])
-            ws.cell(row=excel_row, column=7, value=row['invoiceNo'])
-            ws.cell(row=excel_row, column=8, value=row['invoiceDate'])
-            ws.cell(row=excel_row, column=9, value=row['TotalAmount'])
+        # Записываем новые данные, начиная с 11-й строки, по явным координатам: строки берем
+        # кортежами в порядке OUTPUT_COLUMNS, без создания Series на каждую строку
+        rows = self.output_df[self.OUTPUT_COLUMNS].itertuples(index=False, name=None)
+        for excel_row, values in enumerate(rows, start=self.OUTPUT_START_ROW):
+            for column, value in enumerate(values, start=1):
+                ws.cell(row=excel_row, column=column, value=value)
 
         # Сохраняем изменения в новый файл
         wb.save(self.new_filename)
         wb.close()
 
-        print(f"Обработано строк: {row_index}")
-        print(f"Результат сохранен в '{self.new_filename}', начиная с 11-й строки")
+        logger.info("Обработано строк: %s", row_index)
+        logger.info("Результат сохранен в '%s', начиная с %s-й строки", self.new_filename, self.OUTPUT_START_ROW)
 
     def new_specification_file(self):
         # Генерируем уникальное имя для нового файла с временной меткой
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         new_filename = f"Invoice_Specification_{timestamp}.xlsx"
 
-        # Копируем шаблон в новый файл
-        shutil.copy(self.template_path, new_filename)
-
         return new_filename
 
     def run(self):
@@ -269,13 +265,14 @@ class SpecificationGenerator:
             row_index = self.process_data(master_file, fort_qr)
             self.save_to_excel(row_index)
         except ValueError as e:
-            print(f"\nОшибка: {e}")
-            print("Процесс остановлен из-за несоответствия количества пачек и коробок.")
+            logger.error("Ошибка: %s", e)
+            logger.error("Процесс остановлен из-за несоответствия количества пачек и коробок.")
             raise
 
 
 # Вызов класса
 if __name__ == "__main__":
+    configure_logging()
     generator = SpecificationGenerator(
         master_file_path="Мастер файл номенклатуры.xlsx",
         fort_qr_path="FORT_QR_20251224154328.xlsx",
@@ -1,8 +1,13 @@
+import logging
+import numpy as np
 import pandas as pd
-import shutil
-from openpyxl import load_workbook
 from datetime import datetime
 
+from specification_io import TemplateCache, configure_logging, stream_sheet
+
+# Вывод логов настраивает вызывающий код, при запуске скриптом - specification_io.configure_logging
+logger = logging.getLogger(__name__)
+
 
 class SpecificationGenerator:
     """
@@ -33,6 +38,13 @@ class SpecificationGenerator:
     FORT_QR_SKIP_ROWS = range(7, 10)
     OUTPUT_START_ROW = 11
 
+    # Колонки пачек, которые переносятся в выходной файл
+    PACK_COLUMNS = ['productNameRus', 'productNameEng', 'identificationCode']
+
+    # Колонки, которые читаются из входных файлов; остальные не разбираются
+    MASTER_FILE_COLUMNS = ['GTIN', 'GTIN Outer', 'GTIN Case', 'SIZE5', 'SIZE2']
+    FORT_QR_COLUMNS = ['GTIN', *PACK_COLUMNS]
+
     def __init__(self, master_file_path: str, fort_qr_path: str, template_path: str):
         """
         Инициализация генератора спецификаций.
@@ -46,6 +58,8 @@ class SpecificationGenerator:
         self.fort_qr_path = fort_qr_path
         self.template_path = template_path
         self.output_df = pd.DataFrame(columns=self.OUTPUT_COLUMNS)
+        # Шаблон: читается с диска один раз и переиспользуется при каждом сохранении
+        self._template = TemplateCache(template_path)
         self.new_filename = None
 
     def load_data(self) -> tuple[pd.DataFrame, pd.DataFrame]:
@@ -68,37 +82,34 @@ class SpecificationGenerator:
 
     def _load_master_file(self) -> pd.DataFrame:
         """Загрузка мастер-файла с фильтрацией по SIZE5."""
-        master_file = pd.read_excel(
+        master_file = stream_sheet(
             self.master_file_path,
-            sheet_name=0,
-            header=self.MASTER_FILE_HEADER_ROW
+            header_row=self.MASTER_FILE_HEADER_ROW,
+            columns=self.MASTER_FILE_COLUMNS
         )
         # Фильтруем только строки с заполненным SIZE5
         return master_file[master_file['SIZE5'].notna()]
 
     def _load_fort_qr_file(self) -> pd.DataFrame:
         """Загрузка файла FORT_QR с учетом специфической структуры."""
-        return pd.read_excel(
+        return stream_sheet(
             self.fort_qr_path,
-            sheet_name=0,
-            header=self.FORT_QR_HEADER_ROW,
-            skiprows=self.FORT_QR_SKIP_ROWS
+            header_row=self.FORT_QR_HEADER_ROW,
+            columns=self.FORT_QR_COLUMNS,
+            skip_rows=self.FORT_QR_SKIP_ROWS
         )
 
     def _convert_gtin_to_string(self, master_file: pd.DataFrame, fort_qr: pd.DataFrame) -> None:
         """Преобразование GTIN кодов в строковый формат."""
-        gtin_columns = ['GTIN', 'GTIN Outer', 'GTIN Case']
-
-        for column in gtin_columns:
-            if column in master_file.columns:
-                master_file[column] = master_file[column].apply(
-                    lambda x: str(int(x)) if pd.notna(x) else x
-                )
-
+        gtin_columns = [(master_file, column) for column in ('GTIN', 'GTIN Outer', 'GTIN Case')
+                        if column in master_file.columns]
         if 'GTIN' in fort_qr.columns:
-            fort_qr['GTIN'] = fort_qr['GTIN'].apply(
-                lambda x: str(int(x)) if pd.notna(x) else x
-            )
+            gtin_columns.append((fort_qr, 'GTIN'))
+
+        # Векторное приведение вместо поячеечного apply: nullable Int64 сохраняет пустые
+        # значения (pd.NA) и убирает дробную часть, которую Excel дает числовым ячейкам
+        for df, column in gtin_columns:
+            df[column] = pd.to_numeric(df[column]).astype('Int64').astype('string')
 
     def process_data(self, master_file: pd.DataFrame, fort_qr: pd.DataFrame) -> int:
         """
@@ -116,52 +127,49 @@ class SpecificationGenerator:
         """
         self._print_matching_statistics(master_file, fort_qr)
 
-        row_index = 0
-
-        for _, master_row in master_file.iterrows():
-            row_index = self._process_master_row(master_row, fort_qr, row_index)
-
-        return row_index
+        # Раскладка идет векторно, без цикла по строкам мастер-файла: пачки присоединяются к строкам
+        # одним merge, номера коробки и мастер-кейса считаются по порядковому номеру пачки в строке
+        master = master_file.reset_index(drop=True)
+        sizes = self._get_package_size_columns(master)
+
+        # Ошибку поднимаем для первой ошибочной строки мастер-файла, как при построчной обработке:
+        # коды коробок и мастер-кейсов проверяются у строк до первой строки с некорректным
+        # распределением, и если коды кончаются раньше, ошибка будет о них
+        invalid_position = self._find_invalid_distribution(master, fort_qr, sizes)
+        checked = master.iloc[:invalid_position]
+        packs = self._build_pack_table(checked, fort_qr, sizes)
+        self._validate_pack_codes(checked, packs, fort_qr)
+        if invalid_position is not None:
+            self._raise_distribution_error(master, fort_qr, invalid_position)
+        packs = self._attach_identification_codes(packs, fort_qr)
+        self._print_row_statistics(master, packs)
+
+        self.output_df = pd.DataFrame({
+            'productNameRus': packs['productNameRus'].to_numpy(),
+            'productNameEng': packs['productNameEng'].to_numpy(),
+            'identificationCode': packs['identificationCode'].to_numpy(),
+            'identificationCodeOuter': packs['identificationCodeOuter'].to_numpy(),
+            'identificationCodeCase': packs['identificationCodeCase'].to_numpy(),
+            'identificationCodePallet': None,
+            'invoiceNo': None,
+            'invoiceDate': None,
+            'TotalAmount': None
+        }, columns=self.OUTPUT_COLUMNS)
+
+        return len(self.output_df)
 
     def _print_matching_statistics(self, master_file: pd.DataFrame, fort_qr: pd.DataFrame) -> None:
         """Вывод статистики совпадений GTIN кодов."""
-        outer_matches = fort_qr[fort_qr['GTIN'].isin(master_file['GTIN Outer'])]
-        case_matches = fort_qr[fort_qr['GTIN'].isin(master_file['GTIN Case'])]
-
-        print(f"Найдено совпадений GTIN Outer: {len(outer_matches)}")
-        print(f"Найдено совпадений GTIN Case: {len(case_matches)}")
-
-    def _process_master_row(self, master_row: pd.Series, fort_qr: pd.DataFrame, row_index: int) -> int:
-        """
-        Обработка одной строки мастер-файла.
+        # Множества GTIN строим один раз, isin по ним не пересобирает хеш-таблицу из Series
+        outer_gtins = set(master_file['GTIN Outer'].dropna())
+        case_gtins = set(master_file['GTIN Case'].dropna())
 
-        Args:
-            master_row: Строка из мастер-файла
-            fort_qr: DataFrame с QR-кодами
-            row_index: Текущий индекс строки в выходном файле
-
-        Returns:
-            Обновленный индекс строки
-        """
-        gtin_outer = master_row['GTIN Outer']
-        gtin_case = master_row['GTIN Case']
+        # Для вывода нужно только количество совпадений - считаем его суммой по маске, без выборки строк
+        outer_count = int(fort_qr['GTIN'].isin(outer_gtins).sum())
+        case_count = int(fort_qr['GTIN'].isin(case_gtins).sum())
 
-        print(f"\nОбработка GTIN Outer: {gtin_outer}, GTIN Case: {gtin_case}")
-
-        # Получение данных о пачках и упаковках
-        pack_rows = fort_qr[fort_qr['GTIN'] == master_row['GTIN']]
-        case_rows = fort_qr[fort_qr['GTIN'] == gtin_case]
-
-        # Валидация и расчет распределения
-        size5, size2 = self._get_package_sizes(master_row)
-        full_chunks, remainder = self._calculate_distribution(pack_rows, size5)
-
-        self._validate_distribution(pack_rows, case_rows, size5, size2, gtin_case, remainder)
-
-        # Обработка полных порций
-        return self._process_chunks(
-            pack_rows, case_rows, master_row, full_chunks, size5, size2, row_index
-        )
+        logger.info("Найдено совпадений GTIN Outer: %s", outer_count)
+        logger.info("Найдено совпадений GTIN Case: %s", case_count)
 
     def _get_package_sizes(self, master_row: pd.Series) -> tuple[int, int]:
         """Получение размеров упаковок из мастер-файла."""
@@ -169,148 +177,165 @@ class SpecificationGenerator:
         size2 = int(master_row['SIZE2']) if pd.notna(master_row['SIZE2']) else float('inf')
         return size5, size2
 
-    def _calculate_distribution(self, pack_rows: pd.DataFrame, size5: int) -> tuple[int, int]:
-        """Расчет распределения пачек по коробкам."""
-        total_rows = len(pack_rows)
-        full_chunks = total_rows // size5
-        remainder = total_rows % size5
-
-        print(
-            f"Всего пачек: {total_rows}, размер коробки (SIZE5): {size5}, "
-            f"полных коробок: {full_chunks}, остаток пачек: {remainder}"
+    def _get_package_size_columns(self, master: pd.DataFrame) -> pd.DataFrame:
+        """Размеры упаковок всех строк мастер-файла сразу, по правилам _get_package_sizes."""
+        # Целая часть размера, пустое значение - бесконечность
+        return np.trunc(master[['SIZE5', 'SIZE2']].apply(pd.to_numeric)).fillna(np.inf)
+
+    def _build_pack_table(self, master: pd.DataFrame, fort_qr: pd.DataFrame, sizes: pd.DataFrame) -> pd.DataFrame:
+        """Таблица пачек: строки FORT_QR, присоединенные к строкам мастер-файла по GTIN, с номерами порций."""
+        master_rows = master[['GTIN', 'GTIN Outer', 'GTIN Case']].assign(_master_row=master.index)
+        fort_rows = fort_qr[['GTIN', *self.PACK_COLUMNS]].dropna(subset=['GTIN'])
+        fort_rows = fort_rows.assign(_fort_row=np.arange(len(fort_rows)))
+
+        # Строки без GTIN не сопоставляются (merge сопоставил бы пустые ключи между собой);
+        # устойчивая сортировка сохраняет порядок мастер-файла и порядок пачек внутри строки
+        packs = master_rows.dropna(subset=['GTIN']).merge(fort_rows, on='GTIN')
+        packs = packs.sort_values(['_master_row', '_fort_row'], kind='stable', ignore_index=True)
+
+        # У строк с пачками размеры конечны: сюда попадают только строки до первой
+        # с некорректным распределением (см. _find_invalid_distribution)
+        size5 = packs['_master_row'].map(sizes['SIZE5'])
+        size2 = packs['_master_row'].map(sizes['SIZE2'])
+
+        pack_nums = packs.groupby('_master_row').cumcount()
+        packs['_chunk'] = (pack_nums // size5).astype('int64')
+        # Номер мастер-кейса целочисленно: chunk // (size2 / size5) без перехода к float и его ошибок округления
+        packs['_case_index'] = packs['_chunk'] * size5.astype('int64') // size2.astype('int64')
+        return packs
+
+    def _validate_pack_codes(self, master: pd.DataFrame, packs: pd.DataFrame, fort_qr: pd.DataFrame) -> None:
+        """Проверка наличия кодов коробки и мастер-кейса для каждой порции пачек."""
+        chunks = packs.drop_duplicates(['_master_row', '_chunk'])
+        code_counts = fort_qr.groupby('GTIN').size()
+        missing = (
+            (chunks['_chunk'] >= chunks['GTIN Outer'].map(code_counts).fillna(0))
+            | (chunks['_case_index'] >= chunks['GTIN Case'].map(code_counts).fillna(0))
+        )
+        if not missing.any():
+            return
+
+        # Ошибку поднимаем для первой строки мастер-файла с недостающими кодами, как при построчной обработке
+        position = chunks.loc[missing, '_master_row'].iloc[0]
+        master_row = master.loc[position]
+        self._validate_identification_codes(
+            self._get_codes(fort_qr, master_row['GTIN Outer']),
+            self._get_codes(fort_qr, master_row['GTIN Case']),
+            chunks.loc[chunks['_master_row'] == position, '_case_index'].to_numpy(),
+            master_row['GTIN Outer']
         )
 
-        return full_chunks, remainder
+    def _attach_identification_codes(self, packs: pd.DataFrame, fort_qr: pd.DataFrame) -> pd.DataFrame:
+        """Присоединение кодов коробки и мастер-кейса к пачкам по номеру порции."""
+        # Коды одного GTIN нумеруются в порядке FORT_QR: k-й код - k-я коробка (мастер-кейс)
+        codes = fort_qr[['GTIN', 'identificationCode']].dropna(subset=['GTIN'])
+        codes = codes.assign(_code_num=codes.groupby('GTIN').cumcount())
+
+        outer_codes = codes.rename(columns={
+            'GTIN': 'GTIN Outer', 'identificationCode': 'identificationCodeOuter', '_code_num': '_chunk'
+        })
+        case_codes = codes.rename(columns={
+            'GTIN': 'GTIN Case', 'identificationCode': 'identificationCodeCase', '_code_num': '_case_index'
+        })
+        packs = packs.merge(outer_codes, on=['GTIN Outer', '_chunk'], how='left')
+        return packs.merge(case_codes, on=['GTIN Case', '_case_index'], how='left')
+
+    def _print_row_statistics(self, master: pd.DataFrame, packs: pd.DataFrame) -> None:
+        """Вывод статистики раскладки по строкам мастер-файла."""
+        pack_counts = packs.groupby('_master_row').size().reindex(master.index, fill_value=0)
+        processed = pack_counts.cumsum()
+
+        for gtin_outer, gtin_case, total_packs, row_index in zip(
+                master['GTIN Outer'], master['GTIN Case'], pack_counts, processed
+        ):
+            logger.debug("Обработка GTIN Outer: %s, GTIN Case: %s", gtin_outer, gtin_case)
+            logger.debug("Всего пачек: %s, обработано строк для GTIN Outer %s: %s", total_packs, gtin_outer, row_index)
+
+    def _find_invalid_distribution(
+            self,
+            master: pd.DataFrame,
+            fort_qr: pd.DataFrame,
+            sizes: pd.DataFrame
+    ) -> int | None:
+        """Векторная проверка распределения товаров: позиция первой некорректной строки мастер-файла или None."""
+        pack_counts = master['GTIN'].map(fort_qr.groupby('GTIN').size()).fillna(0)
+
+        invalid = ((pack_counts % sizes['SIZE5']) != 0) | ((pack_counts % sizes['SIZE2']) != 0)
+        return int(invalid.to_numpy().argmax()) if invalid.any() else None
+
+    def _raise_distribution_error(self, master: pd.DataFrame, fort_qr: pd.DataFrame, position: int) -> None:
+        """Ошибка распределения для строки мастер-файла, найденной _find_invalid_distribution."""
+        # Размеры для текста сообщения берем скалярно, чтобы они печатались целыми числами
+        counts_by_gtin = fort_qr.groupby('GTIN').size()
+        master_row = master.iloc[position]
+        size5, size2 = self._get_package_sizes(master_row)
+        total_packs = int(master['GTIN'].map(counts_by_gtin).fillna(0).iloc[position])
+        total_cases = int(master['GTIN Case'].map(counts_by_gtin).fillna(0).iloc[position])
+
+        self._validate_distribution(total_packs, total_cases, size5, size2, master_row['GTIN Case'])
 
     def _validate_distribution(
             self,
-            pack_rows: pd.DataFrame,
-            case_rows: pd.DataFrame,
+            total_packs: int,
+            total_cases: int,
             size5: int,
             size2: int,
-            gtin_case: str,
-            remainder: int
+            gtin_case: str
     ) -> None:
-        """Валидация корректности распределения товаров."""
+        """Валидация корректности распределения товаров одной строки мастер-файла."""
         # Проверка остатка пачек
+        remainder = total_packs % size5
         if remainder > 0:
             raise ValueError(
                 f"Ошибка распределения для GTIN Case {gtin_case}: "
-                f"{len(pack_rows)} пачек не могут быть равномерно распределены "
+                f"{total_packs} пачек не могут быть равномерно распределены "
                 f"в коробки по {size5} пачек. Остаток: {remainder} пачек."
             )
 
         # Проверка распределения мастер-кейсов
-        total_cases = len(case_rows)
-        print(f"Всего мастер-кейсов: {total_cases}, размер паллета (SIZE2): {size2}")
-
-        if len(pack_rows) % size2 != 0:
+        if total_packs % size2 != 0:
             raise ValueError(
                 f"Ошибка распределения для GTIN Case {gtin_case}: "
                 f"{total_cases} мастер-кейсов не могут быть равномерно распределены "
-                f"по {size2} на паллет. Остаток: {len(pack_rows) % size2} кейсов."
+                f"по {size2} на паллет. Остаток: {total_packs % size2} кейсов."
             )
 
-    def _process_chunks(
-            self,
-            pack_rows: pd.DataFrame,
-            case_rows: pd.DataFrame,
-            master_row: pd.Series,
-            full_chunks: int,
-            size5: int,
-            size2: int,
-            row_index: int
-    ) -> int:
-        """Обработка полных порций пачек."""
-        fort_qr_outer = self._get_fort_qr_data()
+    def _get_codes(self, fort_qr: pd.DataFrame, gtin: str) -> np.ndarray:
+        """Получение кодов идентификации FORT_QR по GTIN."""
+        if pd.isna(gtin):
+            return fort_qr['identificationCode'].to_numpy()[:0]
+        return fort_qr.loc[fort_qr['GTIN'] == gtin, 'identificationCode'].to_numpy()
 
-        for chunk_num in range(full_chunks):
-            chunk = self._get_chunk(pack_rows, chunk_num, size5)
-
-            # Получение кодов идентификации
-            identification_outer = self._get_outer_identification_code(
-                fort_qr_outer, master_row['GTIN Outer'], chunk_num
-            )
-            identification_case = self._get_case_identification_code(
-                case_rows, chunk_num, size5, size2
+    def _validate_identification_codes(
+            self,
+            outer_codes: np.ndarray,
+            case_codes: np.ndarray,
+            case_indexes: np.ndarray,
+            gtin_outer: str
+    ) -> None:
+        """Проверка наличия кодов коробки и мастер-кейса для каждой полной порции."""
+        # Ошибку поднимаем для первой порции без кода, как при поочередной обработке порций:
+        # в пределах порции код коробки проверяется раньше кода мастер-кейса
+        full_chunks = len(case_indexes)
+        first_outer_error = min(len(outer_codes), full_chunks)
+        case_errors = np.flatnonzero(case_indexes >= len(case_codes))
+        first_case_error = int(case_errors[0]) if len(case_errors) else full_chunks
+
+        if first_outer_error < full_chunks and first_outer_error <= first_case_error:
+            if len(outer_codes) == 0:
+                raise ValueError(f"Не найдены строки с GTIN Outer: {gtin_outer}")
+            raise ValueError(
+                f"Индекс {first_outer_error} превышает количество найденных строк "
+                f"({len(outer_codes)}) для GTIN Outer: {gtin_outer}"
             )
-
-            # Добавление строк в выходной DataFrame
-            row_index = self._add_chunk_to_output(
-                chunk, identification_outer, identification_case, row_index
+        if first_case_error < full_chunks:
+            if len(case_codes) == 0:
+                raise ValueError("Не найдены строки для мастер-кейса")
+            raise ValueError(
+                f"Индекс мастер-кейса {case_indexes[first_case_error]} превышает количество "
+                f"найденных строк ({len(case_codes)})"
             )
 
-        print(f"Обработано строк для GTIN Outer {master_row['GTIN Outer']}: {row_index}")
-        return row_index
-
-    def _get_fort_qr_data(self) -> pd.DataFrame:
-        """Получение данных FORT_QR для повторного использования."""
-        return pd.read_excel(
-            self.fort_qr_path,
-            sheet_name=0,
-            header=self.FORT_QR_HEADER_ROW,
-            skiprows=self.FORT_QR_SKIP_ROWS
-        )
-
-    def _get_chunk(self, pack_rows: pd.DataFrame, chunk_num: int, size5: int) -> pd.DataFrame:
-        """Получение порции пачек для обработки."""
-        start_idx = chunk_num * size5
-        end_idx = (chunk_num + 1) * size5
-        return pack_rows.iloc[start_idx:end_idx]
-
-    def _get_outer_identification_code(
-            self,
-            fort_qr: pd.DataFrame,
-            gtin: str,
-            index: int
-    ) -> str:
-        """Получение кода идентификации по GTIN и индексу."""
-        rows = fort_qr[fort_qr['GTIN'] == int(gtin)]
-        if len(rows) == 0:
-            raise ValueError(f"Не найдены строки с GTIN Outer: {gtin}")
-        if index >= len(rows):
-            raise ValueError(f"Индекс {index} превышает количество найденных строк ({len(rows)}) для GTIN Outer: {gtin}")
-        return rows['identificationCode'].iloc[index]
-
-    def _get_case_identification_code(
-            self,
-            case_rows: pd.DataFrame,
-            chunk_num: int,
-            size5: int,
-            size2: int
-    ) -> str:
-        """Получение кода идентификации мастер-кейса."""
-        if len(case_rows) == 0:
-            raise ValueError(f"Не найдены строки для мастер-кейса")
-        case_index = int(chunk_num // (size2 / size5))
-        if case_index >= len(case_rows):
-            raise ValueError(f"Индекс мастер-кейса {case_index} превышает количество найденных строк ({len(case_rows)})")
-        return case_rows['identificationCode'].iloc[case_index]
-
-    def _add_chunk_to_output(
-            self,
-            chunk: pd.DataFrame,
-            identification_outer: str,
-            identification_case: str,
-            row_index: int
-    ) -> int:
-        """Добавление порции данных в выходной DataFrame."""
-        for _, pack_row in chunk.iterrows():
-            self.output_df.loc[row_index] = {
-                'productNameRus': pack_row['productNameRus'],
-                'productNameEng': pack_row['productNameEng'],
-                'identificationCode': pack_row['identificationCode'],
-                'identificationCodeOuter': identification_outer,
-                'identificationCodeCase': identification_case,
-                'identificationCodePallet': None,
-                'invoiceNo': None,
-                'invoiceDate': None,
-                'TotalAmount': None
-            }
-            row_index += 1
-
-        return row_index
-
     def save_to_excel(self, row_count: int) -> None:
         """
         Сохранение обработанных данных в Excel файл.
@@ -321,33 +346,25 @@ class SpecificationGenerator:
         self.new_filename = self._create_new_specification_file()
         self._write_data_to_excel()
 
-        print(f"Обработано строк: {row_count}")
-        print(f"Результат сохранен в '{self.new_filename}', начиная с {self.OUTPUT_START_ROW}-й строки")
+        logger.info("Обработано строк: %s", row_count)
+        logger.info("Результат сохранен в '%s', начиная с %s-й строки", self.new_filename, self.OUTPUT_START_ROW)
 
     def _create_new_specification_file(self) -> str:
-        """Создание нового файла спецификации на основе шаблона."""
+        """Генерация уникального имени нового файла спецификации."""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        new_filename = f"Invoice_Specification_{timestamp}.xlsx"
-        shutil.copy(self.template_path, new_filename)
-        return new_filename
+        return f"Invoice_Specification_{timestamp}.xlsx"
 
     def _write_data_to_excel(self) -> None:
         """Запись данных в Excel файл."""
-        wb = load_workbook(self.new_filename)
+        wb = self._template.open()
         ws = wb['Invoice specification']
 
-        # Записываем новые данные, начиная с 11-й строки (индекс 10 в Python)
-        for index, row in self.output_df.iterrows():
-            excel_row = 11 + index
-            ws.cell(row=excel_row, column=1, value=row['productNameRus'])
-            ws.cell(row=excel_row, column=2, value=row['productNameEng'])
-            ws.cell(row=excel_row, column=3, value=row['identificationCode'])
-            ws.cell(row=excel_row, column=4, value=row['identificationCodeOuter'])
-            ws.cell(row=excel_row, column=5, value=row['identificationCodeCase'])
-            ws.cell(row=excel_row, column=6, value=row['identificationCodePallet'] if 'identificationCodePallet' in row else None)
-            ws.cell(row=excel_row, column=7, value=row['invoiceNo'] if 'invoiceNo' in row else None)
-            ws.cell(row=excel_row, column=8, value=row['invoiceDate'] if 'invoiceDate' in row else None)
-            ws.cell(row=excel_row, column=9, value=row['TotalAmount'] if 'TotalAmount' in row else None)
+        # Записываем новые данные, начиная с 11-й строки (индекс 10 в Python): строки берем
+        # кортежами в порядке OUTPUT_COLUMNS, без создания Series на каждую строку
+        rows = self.output_df[self.OUTPUT_COLUMNS].itertuples(index=False, name=None)
+        for excel_row, values in enumerate(rows, start=self.OUTPUT_START_ROW):
+            for column, value in enumerate(values, start=1):
+                ws.cell(row=excel_row, column=column, value=value)
 
         # Сохраняем изменения в новый файл
         wb.save(self.new_filename)
@@ -372,16 +389,17 @@ def generate_specification(master_file_path: str, fort_qr_path: str, template_pa
         row_count = generator.process_data(master_file, fort_qr)
         generator.save_to_excel(row_count)
 
-        print("Спецификация успешно создана!")
+        logger.info("Спецификация успешно создана!")
         return generator.new_filename
 
     except Exception as e:
-        print(f"Ошибка при создании спецификации: {e}")
+        logger.error("Ошибка при создании спецификации: %s", e)
         return None
 
 
 # Вызов класса
 if __name__ == "__main__":
+    configure_logging()
     # Использование функции
     result_file = generate_specification(
         master_file_path="Мастер файл номенклатуры.xlsx",
@@ -390,4 +408,4 @@ if __name__ == "__main__":
     )
 
     if result_file:
-        print(f"Файл создан: {result_file}")
+        logger.info("Файл создан: %s", result_file)
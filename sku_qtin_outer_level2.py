@@ -1,98 +1,134 @@
+import logging
+import numpy as np
 import pandas as pd
-import shutil
-from openpyxl import load_workbook
 from datetime import datetime
 
+from specification_io import TemplateCache, configure_logging, stream_sheet
+
+# Вывод логов настраивает вызывающий код, при запуске скриптом - specification_io.configure_logging
+logger = logging.getLogger(__name__)
+
 
 class SpecificationGenerator:
 
+    # Колонки выходного файла в порядке записи
+    OUTPUT_COLUMNS = [
+        'productNameRus', 'productNameEng', 'identificationCode',
+        'identificationCodeOuter', 'identificationCodeCase', 'identificationCodePallet',
+        'invoiceNo', 'invoiceDate', 'TotalAmount'
+    ]
+    # Первая строка данных на листе шаблона: шапка занимает строки 1-10
+    OUTPUT_START_ROW = 11
+
+    # Колонки, которые читаем из входных файлов; остальные не разбираем
+    MASTER_FILE_COLUMNS = ['SKU', 'GTIN', 'GTIN Outer', 'SIZE5']
+    FORT_QR_COLUMNS = ['GTIN', 'buyerSKU', 'productNameRus', 'productNameEng', 'identificationCode']
+    # Колонки пачек, которые нужны для раскладки по коробкам
+    PACK_COLUMNS = ['productNameRus', 'productNameEng', 'identificationCode']
+
     def __init__(self, master_file_path, fort_qr_path, template_path):
         self.master_file_path = master_file_path
         self.fort_qr_path = fort_qr_path
         self.template_path = template_path
-        self.output_df = pd.DataFrame(columns=[
-            'productNameRus',
-            'productNameEng',
-            'identificationCode',
-            'identificationCodeOuter',
-            'identificationCodeCase',
-            'identificationCodePallet',
-            'invoiceNo',
-            'invoiceDate',
-            'TotalAmount'
-        ])
+        self.output_df = pd.DataFrame(columns=self.OUTPUT_COLUMNS)
+        # Содержимое шаблона читаем с диска один раз и переиспользуем при каждом сохранении
+        self._template = TemplateCache(template_path)
         self.new_filename = None
 
     def load_data(self):
         # Читаем данные из XLSX файлов
         # Для Мастер файла: заголовки в 1-й строке (индекс 0), данные со 2-й (индекс 1)
-        master_file = pd.read_excel(self.master_file_path, sheet_name=0, header=0)
+        master_file = stream_sheet(self.master_file_path, header_row=0, columns=self.MASTER_FILE_COLUMNS)
         # Ограничиваем master_file до строк, где SIZE5 не пустой
         master_file = master_file[master_file['SIZE5'].notna()]
 
         # Для FORT_QR: заголовки в 7-й строке (индекс 6), данные с 11-й (индекс 10)
-        fort_qr = pd.read_excel(self.fort_qr_path, sheet_name=0, header=6, skiprows=range(7, 10))
+        fort_qr = stream_sheet(self.fort_qr_path, header_row=6, columns=self.FORT_QR_COLUMNS,
+                              skip_rows=range(7, 10))
+
+        gtin_columns = [(master_file, column) for column in ('GTIN', 'GTIN Outer')
+                        if column in master_file.columns]
+        gtin_columns.append((fort_qr, 'GTIN'))
+
+        # Преобразуем GTIN коды в строки одним векторным приведением: nullable Int64 сохраняет
+        # пустые значения (pd.NA) и убирает дробную часть, которую Excel дает числовым ячейкам
+        for df, column in gtin_columns:
+            df[column] = pd.to_numeric(df[column]).astype('Int64').astype('string')
+
+        # Переводим GTIN коды в category с общим набором категорий: isin, сравнения и merge
+        # работают с целочисленными кодами категорий вместо сравнения строк
+        categories = pd.Index(pd.unique(pd.concat([df[column] for df, column in gtin_columns]).dropna()))
+        for df, column in gtin_columns:
+            df[column] = pd.Categorical(df[column], categories=categories)
 
-        # Преобразуем GTIN и GTIN Outer в строки, если они не пустые
-        master_file['GTIN'] = master_file['GTIN'].apply(lambda x: str(int(x)) if pd.notna(x) else x)
-        master_file['GTIN Outer'] = master_file['GTIN Outer'].apply(lambda x: str(int(x)) if pd.notna(x) else x)
-        fort_qr['GTIN'] = fort_qr['GTIN'].apply(lambda x: str(int(x)) if pd.notna(x) else x)
+        # Индексируем FORT_QR по GTIN: выборка строк одного GTIN идет через индекс, а не сканированием
+        # всей таблицы. Сортировка устойчивая - порядок строк внутри GTIN сохраняется. Имя индекса
+        # убираем, чтобы колонка GTIN оставалась однозначной для merge
+        fort_qr = fort_qr.set_index('GTIN', drop=False).rename_axis(None).sort_index(kind='stable')
 
         return master_file, fort_qr
 
+    def _select_gtin(self, fort_qr, gtin):
+        # Строки FORT_QR с заданным GTIN через индекс; пустая выборка, если такого GTIN в файле нет
+        if pd.isna(gtin):
+            return fort_qr.iloc[0:0]
+        try:
+            return fort_qr.loc[[gtin]]
+        except KeyError:
+            return fort_qr.iloc[0:0]
+
+    def _select_packs(self, fort_qr_packs, gtin, sku):
+        # Пачки FORT_QR с заданными GTIN и buyerSKU через составной индекс; пустая выборка, если их нет
+        try:
+            return fort_qr_packs.loc[[(gtin, sku)]]
+        except KeyError:
+            return fort_qr_packs.iloc[0:0]
+
     def process_data(self, master_file, fort_qr):
         # 1. Находим все GTIN Outer из мастер файла в FORT_QR
         # outer_matches = fort_qr[fort_qr['GTIN'].isin(master_file['GTIN Outer'])]
 
-        # --------------------------------------------------------------
-        # 1. Делаем вспомогательный DataFrame только с нужными колонками из мастер-файла
-        #    (SKU → GTIN Outer). Если один SKU встречается несколько раз — оставляем все строки.
-        # --------------------------------------------------------------
-        master_lookup = master_file[['SKU', 'GTIN Outer']].dropna().copy()
-
-        # Приводим типы к строке (на всякий случай, чтобы не было проблем с int/float)
-        master_lookup['SKU'] = master_lookup['SKU'].astype(str)
-        master_lookup['GTIN Outer'] = master_lookup['GTIN Outer'].astype(str)
-
         fort_qr['buyerSKU'] = fort_qr['buyerSKU'].astype(str)
-        fort_qr['GTIN'] = fort_qr['GTIN'].astype(str)
-
-        # --------------------------------------------------------------
-        # 2. Присоединяем к fort_qr информацию о том, есть ли такое сочетание SKU + GTIN Outer в мастер-файле
-        #    how='left' — оставляем все строки из fort_qr
-        #    left_on  — две колонки слева
-        #    right_on — две колонки справа
-        # --------------------------------------------------------------
-        merged = fort_qr.merge(
-            master_lookup,
-            how='left',
-            left_on=['buyerSKU', 'GTIN'],
-            right_on=['SKU', 'GTIN Outer']
-        )
+        # buyerSKU для сравнения с SKU нормализуем один раз, а не заново на каждой строке мастер файла
+        fort_qr['_buyer_sku'] = fort_qr['buyerSKU'].str.strip()
+        # Составной индекс (GTIN, buyerSKU): пачки строки мастер файла выбираются одним поиском по индексу
+        # вместо маски по всем строкам GTIN. Сортировка устойчивая - порядок пачек сохраняется
+        fort_qr_packs = (fort_qr.set_index(['GTIN', '_buyer_sku'], drop=False)
+                         .rename_axis([None, None]).sort_index(kind='stable'))
 
         # --------------------------------------------------------------
-        # 3. Оставляем только те строки fort_qr, у которых нашлось совпадение
-        #    (т.е. колонка 'SKU' не NaN после merge)
-        # --------------------------------------------------------------
-        outer_matches = merged[merged['SKU'].notna()].copy()
-
-        # Если нужно — можно сразу удалить вспомогательные колонки, чтобы дальше работать как раньше
-        outer_matches = outer_matches.drop(columns=['SKU', 'GTIN Outer_y'], errors='ignore')
-        # (GTIN Outer может быть и под именем 'GTIN Outer_x' — оставляем оригинальный 'GTIN')
-
-        # print(f"Найдено совпадений по GTIN Outer + buyerSKU: {len(outer_matches)}")
+        # 1. Считаем строки fort_qr, у которых сочетание buyerSKU + GTIN есть в мастер-файле как SKU + GTIN Outer.
+        #    Число нужно только для сводки, поэтому вместо merge с полными строками перемножаем количества
+        #    строк по каждому сочетанию с обеих сторон - результат тот же, что len() левого merge с совпадением
         # --------------------------------------------------------------
-
-        # 2. Считаем количество совпадений
-        outer_count = len(outer_matches)
-        print(f"Найдено совпадений GTIN Outer: {outer_count}")
+        if logger.isEnabledFor(logging.INFO):
+            # Вспомогательный DataFrame только с нужными колонками из мастер-файла (SKU → GTIN Outer).
+            # Если один SKU встречается несколько раз — оставляем все строки. SKU приводим к строке
+            # (на всякий случай, чтобы не было проблем с int/float); GTIN уже приведены к общему category
+            master_lookup = master_file[['SKU', 'GTIN Outer']].dropna().copy()
+            master_lookup['SKU'] = master_lookup['SKU'].astype(str)
+
+            pair_names = ['SKU', 'GTIN']
+            fort_pairs = fort_qr.groupby(['buyerSKU', 'GTIN'], observed=True).size().rename_axis(pair_names)
+            master_pairs = master_lookup.groupby(['SKU', 'GTIN Outer'], observed=True).size().rename_axis(pair_names)
+            outer_count = int(fort_pairs.mul(master_pairs).sum())
+            logger.info("Найдено совпадений GTIN Outer: %s", outer_count)
 
         # 3. Итерация по мастер файлу
         row_index = 0
 
-        for _, master_row in master_file.iterrows():
-            current_gtin = master_row['GTIN Outer']
-            print(f"\nОбработка GTIN Outer: {current_gtin}")
+        # itertuples не создает Series на каждую строку; колонку с пробелом переименовываем,
+        # чтобы обращаться к ней как к атрибуту
+        master_rows = master_file.rename(columns={'GTIN Outer': 'GTIN_Outer'})
+
+        # Колонки строк спецификации каждой строки мастер файла; собираем их в выход после цикла
+        results = []
+        # Количество пачек по GTIN Outer для итоговой сводки
+        packs_by_outer = {}
+
+        for master_row in master_rows.itertuples(index=False, name='MasterRow'):
+            current_gtin = master_row.GTIN_Outer
+            logger.debug("Обработка GTIN Outer: %s", current_gtin)
 
             # Находим все строки с соответствующим GTIN
             # pack_rows = fort_qr[fort_qr['GTIN'] == master_row['GTIN']]
@@ -101,36 +137,31 @@ class SpecificationGenerator:
             # 1. Имеют GTIN == master_row['GTIN'] (это код пачки)
             # 2. И при этом их buyerSKU соответствует SKU из текущей строки master_file
             # ------------------------------------------------------------------
-            current_sku = str(master_row['SKU']).strip()
-            current_gtin_pack = str(master_row['GTIN']).strip() if pd.notna(master_row['GTIN']) else None
+            current_sku = str(master_row.SKU).strip()
+            current_gtin_pack = str(master_row.GTIN).strip() if pd.notna(master_row.GTIN) else None
 
             if not current_gtin_pack or current_gtin_pack == 'nan':
-                print(f"Предупреждение: у SKU {current_sku} пустой GTIN пачки — пропускаем")
+                logger.warning("Предупреждение: у SKU %s пустой GTIN пачки — пропускаем", current_sku)
                 continue  # или можно задать пустой pack_rows
 
-            # Фильтруем только пачки с правильным GTIN И правильным buyerSKU
-            pack_rows = fort_qr[
-                (fort_qr['GTIN'] == current_gtin_pack) &
-                (fort_qr['buyerSKU'].astype(str).str.strip() == current_sku)
-                ]
+            # Берем только пачки с правильным GTIN И правильным buyerSKU (через составной индекс)
+            pack_rows = self._select_packs(fort_qr_packs, current_gtin_pack, current_sku)
 
             # Дополнительно: если вдруг ничего не нашли — выводим предупреждение
             if pack_rows.empty:
-                print(f"Внимание: для SKU {current_sku} | GTIN пачки {current_gtin_pack} "
-                      f"не найдено ни одной пачки с buyerSKU = {current_sku}")
+                logger.warning("Внимание: для SKU %s | GTIN пачки %s не найдено ни одной пачки с buyerSKU = %s",
+                               current_sku, current_gtin_pack, current_sku)
 
             # Ограничиваем количество строк согласно SIZE5
-            size5 = int(master_row['SIZE5']) if pd.notna(master_row['SIZE5']) else float('inf')
+            size5 = int(master_row.SIZE5) if pd.notna(master_row.SIZE5) else float('inf')
 
             # Рассчитываем количество полных порций
             total_rows = len(pack_rows)
             full_chunks = total_rows // size5
             remainder = total_rows % size5
 
-            print(
-                f"Всего пачек: {total_rows}, размер коробки (SIZE5): {size5}, "
-                f"полных коробок: {full_chunks}, остаток пачек: {remainder}"
-            )
+            logger.debug("Всего пачек: %s, размер коробки (SIZE5): %s, полных коробок: %s, остаток пачек: %s",
+                         total_rows, size5, full_chunks, remainder)
             # Проверяем наличие остатка
             if remainder > 0:
                 error_msg = (f"Ошибка распределения для GTIN Outer {current_gtin}: "
@@ -139,31 +170,37 @@ class SpecificationGenerator:
                 raise ValueError(error_msg)
 
             # Обрабатываем полные порции
-            for chunk_num in range(full_chunks):
-                start_idx = chunk_num * size5
-                end_idx = (chunk_num + 1) * size5
-                chunk = pack_rows.iloc[start_idx:end_idx]
-
-                # print(f"Обработка порции {chunk_num + 1}/{full_chunks}: строки {start_idx + 1}-{end_idx}")
-                # Получаем identificationCodeOuter для текущего GTIN Outer
-                outer_rows = fort_qr[fort_qr['GTIN'] == master_row['GTIN Outer']]
-                identification_outer = outer_rows['identificationCode'].iloc[chunk_num] if not outer_rows.empty else None
-
-                for _, pack_row in chunk.iterrows():
-                    self.output_df.loc[row_index] = {
-                        'productNameRus': pack_row['productNameRus'],
-                        'productNameEng': pack_row['productNameEng'],
-                        'identificationCode': pack_row['identificationCode'],
-                        'identificationCodeOuter': identification_outer,
-                        'identificationCodeCase': None,
-                        'identificationCodePallet': None,
-                        'invoiceNo': None,
-                        'invoiceDate': None,
-                        'TotalAmount': None
-                    }
-                    row_index += 1
-
-            print(f"Обработано строк для GTIN Outer {current_gtin}: {row_index}")
+            outer_rows = self._select_gtin(fort_qr, master_row.GTIN_Outer)
+            # Кодов коробок должно хватать на все полные порции
+            if 0 < len(outer_rows) < full_chunks:
+                raise ValueError(f"Не хватает кодов коробок для GTIN Outer {current_gtin}: "
+                                 f"требуется {full_chunks}, найдено {len(outer_rows)}")
+            outer_codes = outer_rows['identificationCode'].to_numpy()
+            # Код коробки повторяем для каждой из size5 пачек порции (None, если коробок с таким GTIN нет)
+            identification_outer = np.repeat(outer_codes[:full_chunks], size5) if len(outer_codes) else None
+            results.append((*(pack_rows[column].to_numpy() for column in self.PACK_COLUMNS), identification_outer))
+            # Остатка нет, значит все пачки строки попадают в коробки
+            row_index += total_rows
+            packs_by_outer[current_gtin] = packs_by_outer.get(current_gtin, 0) + total_rows
+
+            logger.debug("Обработано строк для GTIN Outer %s: %s", current_gtin, row_index)
+
+        logger.info("Обработано строк по GTIN Outer: %s", packs_by_outer)
+
+        # Размер выхода уже известен: выделяем массивы колонок сразу нужной длины и заполняем
+        # срезами по смещению каждой строки мастер файла. Остальные колонки выхода пустые
+        filled_columns = self.OUTPUT_COLUMNS[:4]
+        columns = {column: np.empty(row_index, dtype=object) for column in filled_columns}
+        offset = 0
+        for result in results:
+            packs_count = len(result[0])
+            for column, values in zip(filled_columns, result):
+                columns[column][offset:offset + packs_count] = values
+            offset += packs_count
+        columns.update(dict.fromkeys(self.OUTPUT_COLUMNS[4:]))
+
+        # Собираем выходной DataFrame одним вызовом вместо построчного .loc
+        self.output_df = pd.DataFrame(columns, columns=self.OUTPUT_COLUMNS)
 
         return row_index
 
@@ -171,38 +208,29 @@ class SpecificationGenerator:
         # Генерируем уникальное имя для нового файла с временной меткой
         self.new_filename = self.new_specification_file()
 
-        # Загружаем новый файл для записи данных
-        wb = load_workbook(self.new_filename)
+        # Открываем шаблон из памяти: копия файла на диске и повторное чтение не нужны
+        wb = self._template.open()
         ws = wb['Invoice specification']
 
-        # Записываем новые данные, начиная с 11-й строки (индекс 10 в Python)
-        for index, row in self.output_df.iterrows():
-            excel_row = 11 + index
-            ws.cell(row=excel_row, column=1, value=row['productNameRus'])
-            ws.cell(row=excel_row, column=2, value=row['productNameEng'])
-            ws.cell(row=excel_row, column=3, value=row['identificationCode'])
-            ws.cell(row=excel_row, column=4, value=row['identificationCodeOuter'])
-            ws.cell(row=excel_row, column=5, value=row['identificationCodeCase'])
-            ws.cell(row=excel_row, column=6, value=row['identificationCodePallet'])
-            ws.cell(row=excel_row, column=7, value=row['invoiceNo'])
-            ws.cell(row=excel_row, column=8, value=row['invoiceDate'])
-            ws.cell(row=excel_row, column=9, value=row['TotalAmount'])
+        # Записываем новые данные, начиная с 11-й строки, по явным координатам: строки берем
+        # кортежами в порядке OUTPUT_COLUMNS, без создания Series на каждую строку
+        rows = self.output_df[self.OUTPUT_COLUMNS].itertuples(index=False, name=None)
+        for excel_row, values in enumerate(rows, start=self.OUTPUT_START_ROW):
+            for column, value in enumerate(values, start=1):
+                ws.cell(row=excel_row, column=column, value=value)
 
         # Сохраняем изменения в новый файл
         wb.save(self.new_filename)
         wb.close()
 
-        print(f"Обработано строк: {row_index}")
-        print(f"Результат сохранен в '{self.new_filename}', начиная с 11-й строки")
+        logger.info("Обработано строк: %s", row_index)
+        logger.info("Результат сохранен в '%s', начиная с %s-й строки", self.new_filename, self.OUTPUT_START_ROW)
 
     def new_specification_file(self):
         # Генерируем уникальное имя для нового файла с временной меткой
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         new_filename = f"Invoice_Specification_{timestamp}.xlsx"
 
-        # Копируем шаблон в новый файл
-        shutil.copy(self.template_path, new_filename)
-
         return new_filename
 
     def run(self):
@@ -212,13 +240,14 @@ class SpecificationGenerator:
             row_index = self.process_data(master_file, fort_qr)
             self.save_to_excel(row_index)
         except ValueError as e:
-            print(f"\nОшибка: {e}")
-            print("Процесс остановлен из-за несоответствия количества пачек и коробок.")
+            logger.error("Ошибка: %s", e)
+            logger.error("Процесс остановлен из-за несоответствия количества пачек и коробок.")
             raise
 
 
 # Вызов класса
 if __name__ == "__main__":
+    configure_logging()
     generator = SpecificationGenerator(
         master_file_path="Мастер файл номенклатуры.xlsx",
         fort_qr_path="Коды маркировки № 695 от 15.07.2025.xlsx",
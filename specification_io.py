@@ -0,0 +1,88 @@
+"""
+Общие функции ввода-вывода генераторов спецификаций.
+
+Используются скриптами sku_qtin_outer_level2.py, empty_qtin_outer_level2.py и
+gtin_outer_case_level3.py: потоковое чтение входных листов Excel, открытие шаблона
+спецификации из памяти и настройка вывода логов при запуске скриптом.
+"""
+
+import io
+import logging
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Переменная окружения с уровнем логов при запуске скриптом (по умолчанию INFO - только итоги)
+LOG_LEVEL_ENV = 'SPECIFICATION_LOG_LEVEL'
+
+
+def configure_logging() -> None:
+    """
+    Настройка вывода логов для запуска генератора скриптом.
+
+    Модули генераторов только пишут в свои логгеры (подробный ход обработки - на уровне DEBUG),
+    а вывод настраивает вызывающий код. Функция вызывается из блока __main__; уровень задается
+    переменной окружения SPECIFICATION_LOG_LEVEL.
+    """
+    logging.basicConfig(level=os.environ.get(LOG_LEVEL_ENV, 'INFO').upper(), format='%(message)s')
+
+
+def stream_sheet(path: str, header_row: int, columns: list[str], skip_rows: range = range(0)) -> pd.DataFrame:
+    """
+    Потоковое чтение первого листа книги в режиме read_only.
+
+    Стили и остальная структура книги не загружаются, из строк забираются только нужные колонки.
+    Полностью пустые строки пропускаются.
+
+    Args:
+        path: Путь к файлу .xlsx
+        header_row: Индекс строки заголовков
+        columns: Колонки, которые нужно прочитать
+        skip_rows: Индексы служебных строк после заголовков
+
+    Returns:
+        DataFrame с прочитанными колонками
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # Тег <dimension> в выгрузках бывает устаревшим, а read_only лист ограничивает им
+        # iter_rows - сбрасываем размеры, чтобы прочитать все строки и колонки (как pandas)
+        ws.reset_dimensions()
+        rows = ws.iter_rows(values_only=True)
+        for _ in range(header_row):
+            next(rows, None)
+        headers = next(rows, ())
+
+        positions = {}
+        for position, name in enumerate(headers):
+            if name in columns:
+                positions.setdefault(name, position)
+        data = {name: [] for name in positions}
+
+        for row_num, values in enumerate(rows, start=header_row + 1):
+            if row_num in skip_rows or all(value is None for value in values):
+                continue
+            # В read_only режиме строка обрывается на последней заполненной ячейке
+            for name, position in positions.items():
+                data[name].append(values[position] if position < len(values) else None)
+    finally:
+        wb.close()
+
+    return pd.DataFrame(data)
+
+
+class TemplateCache:
+    """Шаблон спецификации: файл читается с диска один раз, каждая книга открывается из памяти."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._bytes: bytes | None = None
+
+    def open(self):
+        """Открытие новой книги шаблона; сам файл шаблона не изменяется."""
+        if self._bytes is None:
+            with open(self.path, 'rb') as template:
+                self._bytes = template.read()
+        return load_workbook(io.BytesIO(self._bytes))
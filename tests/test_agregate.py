@@ -0,0 +1,116 @@
+import io
+
+import pytest
+
+from txt import agregate
+
+
+def test_write_aggregation_xml_groups_codes_by_block():
+    out = io.BytesIO()
+    agregate.write_aggregation_xml(out, ['block-1', 'block-2'], iter(['k1', 'k2', 'k3', 'k4']), '123', 2)
+
+    xml = out.getvalue().decode('utf-8')
+    assert xml.count('<pack_content>') == 2
+    first_pack, second_pack = xml.split('<pack_content>')[1:]
+    assert '<pack_code>block-1</pack_code>' in first_pack
+    assert '<![CDATA[k1]]>' in first_pack and '<![CDATA[k2]]>' in first_pack
+    assert '<![CDATA[k3]]>' in second_pack and '<![CDATA[k4]]>' in second_pack
+
+
+def test_write_aggregation_xml_rejects_too_few_codes():
+    with pytest.raises(ValueError, match='не хватает КИЗ: требуется 2, получено 1'):
+        agregate.write_aggregation_xml(io.BytesIO(), ['block-1', 'block-2'], iter(['k1', 'k2', 'k3']), '123', 2)
+
+
+def test_write_aggregation_xml_rejects_leftover_codes():
+    with pytest.raises(ValueError, match='остались КИЗ'):
+        agregate.write_aggregation_xml(io.BytesIO(), ['block-1'], iter(['k1', 'k2', 'k3']), '123', 2)
+
+
+def test_write_aggregation_file_leaves_no_output_on_error(tmp_path):
+    output_path = tmp_path / 'out.xml'
+    with pytest.raises(ValueError):
+        agregate.write_aggregation_file(output_path, ['block-1', 'block-2'], iter(['k1', 'k2', 'k3']), '123', 2)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_aggregation_file_replaces_output(tmp_path):
+    output_path = tmp_path / 'out.xml'
+    output_path.write_bytes(b'old')
+    agregate.write_aggregation_file(output_path, ['block-1'], ['k1', 'k2'], '123')
+
+    assert output_path.read_bytes().startswith(agregate.XML_DECLARATION)
+    assert list(tmp_path.iterdir()) == [output_path]
+
+
+def test_read_codes_keeps_quoted_csv_field_with_newline(tmp_path):
+    path = tmp_path / 'codes.csv'
+    path.write_bytes('"code","qty"\r\n"0104\n6001",1\r\n0105,2\r\n'.encode('utf-8'))
+
+    assert agregate.read_codes(path) == ['01046001', '0105']
+
+
+def test_read_codes_rejects_unclosed_quote_after_sample(tmp_path, monkeypatch):
+    # Кавычки появляются только после образца: строки разбираются по одной, и перевод строки
+    # внутри поля не склеивается - вместо тихой порчи кода поднимается ошибка
+    monkeypatch.setattr(agregate, 'CSV_SAMPLE_SIZE', 8)
+    path = tmp_path / 'codes.csv'
+    path.write_text('0101,1\n0102,2\n"0103\n9",3\n', encoding='utf-8')
+
+    with pytest.raises(ValueError, match='Незакрытая кавычка'):
+        agregate.read_codes(path)
+
+
+@pytest.mark.parametrize('sample, expected', [
+    ('Код1,Количество\n0104,1\n0105,2\n', (',', True)),
+    ('"Код 2025";qty\n0104;1\n0105;2\n', (';', True)),
+    ('0104\t1\n0105\t2\n', ('\t', False)),
+    ('Код;x\r0104;1\r0105;2\r', (';', True)),
+    ('0104;1\r\n0105;2\r\n', (';', False)),
+])
+def test_detect_csv_layout(sample, expected):
+    assert agregate.detect_csv_layout(sample) == expected
+
+
+@pytest.mark.parametrize('line, delimiter, expected', [
+    ('0104,1', ',', '0104'),
+    ('0104;1', ';', '0104'),
+    ('0104\t1', '\t', '0104'),
+    ('"01;04";1', ';', '01;04'),
+    ('0104', ',', '0104'),
+])
+def test_first_csv_field(line, delimiter, expected):
+    assert agregate.first_csv_field(line, delimiter) == expected
+
+
+@pytest.mark.parametrize('content, expected', [
+    ('Код1,x\n0104,1\n0105,2\n', ['0104', '0105']),
+    ('Код;x\n0104;1\n0105;2\n', ['0104', '0105']),
+    ('0104\t1\n0105\t2\n', ['0104', '0105']),
+    ('Код;x\r0104;1\r0105;2\r', ['0104', '0105']),
+])
+def test_iter_codes_csv(tmp_path, content, expected):
+    path = tmp_path / 'codes.csv'
+    path.write_bytes(content.encode('utf-8'))
+
+    assert list(agregate.iter_codes(path)) == expected
+
+
+def test_iter_codes_txt_with_cr_line_endings(tmp_path):
+    path = tmp_path / 'codes.txt'
+    path.write_bytes(b'0104\x1d91ab\r0105\r\n\r0106')
+
+    assert list(agregate.iter_codes(path)) == ['010491ab', '0105', '0106']
+
+
+@pytest.mark.parametrize('suffix', ['.txt', '.csv'])
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5])
+def test_iter_codes_chunk_boundary_inside_multibyte_char(tmp_path, monkeypatch, suffix, chunk_size):
+    # Кириллица занимает в UTF-8 два байта: маленькие блоки режут символы посередине
+    monkeypatch.setattr(agregate, 'READ_CHUNK_SIZE', chunk_size)
+    monkeypatch.setattr(agregate, 'CSV_SAMPLE_SIZE', chunk_size)
+    path = tmp_path / f'codes{suffix}'
+    path.write_bytes('0104Жв\n0105ачка\n'.encode('utf-8'))
+
+    assert list(agregate.iter_codes(path)) == ['0104Жв', '0105ачка']
@@ -0,0 +1,75 @@
+import warnings
+
+import pandas as pd
+import pytest
+
+from empty_qtin_outer_level2 import SpecificationGenerator
+
+
+def _generator():
+    return SpecificationGenerator('master.xlsx', 'fort_qr.xlsx', 'template.xlsx')
+
+
+def _fort_qr(rows):
+    return pd.DataFrame(rows, columns=['GTIN', 'productNameRus', 'productNameEng', 'identificationCode'])
+
+
+def test_process_data_accepts_text_and_float_sizes():
+    # SIZE5 = "2" - текстовая ячейка, SIZE5 = 2.7 - дробное число: оба размера считаются как int(...) == 2
+    master_file = pd.DataFrame({
+        'SKU': ['A', 'B'],
+        'GTIN': ['g1', 'g2'],
+        'GTIN Outer': ['o1', 'o2'],
+        'GTIN Case': [None, None],
+        'SIZE5': ['2', 2.7],
+        'SIZE2': [None, None],
+    })
+    fort_qr = _fort_qr(
+        [['g1', 'Пачка 1', 'Pack 1', f'p1-{n}'] for n in range(4)]
+        + [['o1', 'Коробка 1', 'Box 1', f'o1-{n}'] for n in range(2)]
+        + [['g2', 'Пачка 2', 'Pack 2', f'p2-{n}'] for n in range(2)]
+        + [['o2', 'Коробка 2', 'Box 2', 'o2-0']]
+    )
+
+    generator = _generator()
+    assert generator.process_data(master_file, fort_qr) == 6
+    assert generator.output_df['identificationCode'].tolist() == ['p1-0', 'p1-1', 'p1-2', 'p1-3', 'p2-0', 'p2-1']
+    assert generator.output_df['identificationCodeOuter'].tolist() == ['o1-0', 'o1-0', 'o1-1', 'o1-1', 'o2-0', 'o2-0']
+
+
+def test_process_data_with_blank_size5_column():
+    # Без GTIN Outer коробкой считается пачка, а SIZE5 пуст во всех строках
+    master_file = pd.DataFrame({
+        'SKU': ['C'],
+        'GTIN': ['g3'],
+        'GTIN Outer': [None],
+        'GTIN Case': [None],
+        'SIZE5': [None],
+        'SIZE2': ['2'],
+    })
+    fort_qr = _fort_qr([['g3', 'Пачка 3', 'Pack 3', f'p3-{n}'] for n in range(4)])
+
+    generator = _generator()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', FutureWarning)
+        assert generator.process_data(master_file, fort_qr) == 4
+    assert generator.output_df['identificationCodeOuter'].tolist() == ['p3-0', 'p3-0', 'p3-2', 'p3-2']
+
+
+def test_process_data_reports_box_index_against_outer_code_count():
+    # 6 пачек по 2 - нужны 3 коробки (индексы 0-2), а кодов GTIN Outer всего 2
+    master_file = pd.DataFrame({
+        'SKU': ['D'],
+        'GTIN': ['g4'],
+        'GTIN Outer': ['o4'],
+        'GTIN Case': [None],
+        'SIZE5': [2],
+        'SIZE2': [None],
+    })
+    fort_qr = _fort_qr(
+        [['g4', 'Пачка 4', 'Pack 4', f'p4-{n}'] for n in range(6)]
+        + [['o4', 'Коробка 4', 'Box 4', f'o4-{n}'] for n in range(2)]
+    )
+
+    with pytest.raises(ValueError, match=r'Индекс коробки 2 превышает количество найденных кодов коробок \(2\)'):
+        _generator().process_data(master_file, fort_qr)
@@ -0,0 +1,113 @@
+import pandas as pd
+import pytest
+
+from gtin_outer_case_level3 import SpecificationGenerator
+
+
+def _generator():
+    return SpecificationGenerator('master.xlsx', 'fort_qr.xlsx', 'template.xlsx')
+
+
+def _master(*rows):
+    return pd.DataFrame(list(rows), columns=['GTIN', 'GTIN Outer', 'GTIN Case', 'SIZE5', 'SIZE2'])
+
+
+def _codes(gtin, count):
+    return [[gtin, f'Товар {gtin}', f'Item {gtin}', f'{gtin}-{n}'] for n in range(count)]
+
+
+def _fort_qr(*groups):
+    rows = [row for group in groups for row in group]
+    return pd.DataFrame(rows, columns=['GTIN', 'productNameRus', 'productNameEng', 'identificationCode'])
+
+
+def test_process_data_keeps_master_order_and_numbers_boxes_and_cases():
+    # Во второй строке SIZE2 не кратен SIZE5: 3 коробки по 2 пачки, мастер-кейс по 3 пачки -
+    # коробки 0 и 1 попадают в мастер-кейс 0, коробка 2 - в мастер-кейс 1 (chunk * size5 // size2)
+    master_file = _master(
+        ['g1', 'o1', 'c1', 2, 4],
+        ['g2', 'o2', 'c2', 2, 3],
+    )
+    # Пачки второй строки идут в FORT_QR раньше первой: порядок выхода задает мастер-файл
+    fort_qr = _fort_qr(_codes('g2', 6), _codes('o2', 3), _codes('c2', 2), _codes('g1', 4), _codes('o1', 2),
+                       _codes('c1', 1))
+
+    generator = _generator()
+    assert generator.process_data(master_file, fort_qr) == 10
+
+    output = generator.output_df
+    assert output['identificationCode'].tolist() == [f'g1-{n}' for n in range(4)] + [f'g2-{n}' for n in range(6)]
+    assert output['identificationCodeOuter'].tolist() == [
+        'o1-0', 'o1-0', 'o1-1', 'o1-1',
+        'o2-0', 'o2-0', 'o2-1', 'o2-1', 'o2-2', 'o2-2',
+    ]
+    assert output['identificationCodeCase'].tolist() == ['c1-0'] * 4 + ['c2-0'] * 4 + ['c2-1'] * 2
+    assert output['productNameRus'].tolist() == ['Товар g1'] * 4 + ['Товар g2'] * 6
+
+
+def test_process_data_rejects_too_few_outer_codes():
+    master_file = _master(['g1', 'o1', 'c1', 2, 4])
+    fort_qr = _fort_qr(_codes('g1', 4), _codes('o1', 1), _codes('c1', 1))
+
+    with pytest.raises(ValueError, match=r'Индекс 1 превышает количество найденных строк \(1\) для GTIN Outer: o1'):
+        _generator().process_data(master_file, fort_qr)
+
+
+def test_process_data_rejects_missing_outer_codes():
+    master_file = _master(['g1', 'o1', 'c1', 2, 4])
+    fort_qr = _fort_qr(_codes('g1', 4), _codes('c1', 1))
+
+    with pytest.raises(ValueError, match='Не найдены строки с GTIN Outer: o1'):
+        _generator().process_data(master_file, fort_qr)
+
+
+def test_process_data_rejects_too_few_case_codes():
+    master_file = _master(['g1', 'o1', 'c1', 2, 2])
+    fort_qr = _fort_qr(_codes('g1', 4), _codes('o1', 2), _codes('c1', 1))
+
+    with pytest.raises(ValueError, match=r'Индекс мастер-кейса 1 превышает количество найденных строк \(1\)'):
+        _generator().process_data(master_file, fort_qr)
+
+
+def test_process_data_rejects_packs_not_multiple_of_size5():
+    master_file = _master(['g1', 'o1', 'c1', 2, 4])
+    fort_qr = _fort_qr(_codes('g1', 5), _codes('o1', 3), _codes('c1', 2))
+
+    with pytest.raises(ValueError, match='5 пачек не могут быть равномерно распределены в коробки по 2 пачек. '
+                                         'Остаток: 1 пачек'):
+        _generator().process_data(master_file, fort_qr)
+
+
+def test_process_data_rejects_packs_not_multiple_of_size2():
+    # 4 пачки делятся на коробки по 2, но не на мастер-кейсы по 3
+    master_file = _master(['g1', 'o1', 'c1', 2, 3])
+    fort_qr = _fort_qr(_codes('g1', 4), _codes('o1', 2), _codes('c1', 2))
+
+    with pytest.raises(ValueError, match='по 3 на паллет. Остаток: 1 кейсов'):
+        _generator().process_data(master_file, fort_qr)
+
+
+def test_process_data_reports_code_shortage_of_earlier_row_first():
+    # Первая строка - нехватка кодов коробок, вторая - ошибка распределения: ошибка о первой строке
+    master_file = _master(
+        ['g1', 'o1', 'c1', 2, 4],
+        ['g2', 'o2', 'c2', 2, 4],
+    )
+    fort_qr = _fort_qr(_codes('g1', 4), _codes('o1', 1), _codes('c1', 1),
+                       _codes('g2', 3), _codes('o2', 2), _codes('c2', 1))
+
+    with pytest.raises(ValueError, match='GTIN Outer: o1'):
+        _generator().process_data(master_file, fort_qr)
+
+
+def test_process_data_reports_distribution_error_of_earlier_row_first():
+    # Первая строка - ошибка распределения, вторая - нехватка кодов мастер-кейса: ошибка о первой строке
+    master_file = _master(
+        ['g1', 'o1', 'c1', 2, 4],
+        ['g2', 'o2', 'c2', 2, 2],
+    )
+    fort_qr = _fort_qr(_codes('g1', 3), _codes('o1', 2), _codes('c1', 1),
+                       _codes('g2', 4), _codes('o2', 2), _codes('c2', 1))
+
+    with pytest.raises(ValueError, match='GTIN Case c1: 3 пачек'):
+        _generator().process_data(master_file, fort_qr)
@@ -0,0 +1,76 @@
+import pytest
+from openpyxl import Workbook
+
+from sku_qtin_outer_level2 import SpecificationGenerator
+
+MASTER_HEADER = ['SKU', 'GTIN', 'GTIN Outer', 'SIZE5']
+FORT_QR_HEADER = ['GTIN', 'buyerSKU', 'productNameRus', 'productNameEng', 'identificationCode']
+
+
+def _save_sheet(path, rows):
+    wb = Workbook()
+    for row in rows:
+        wb.active.append(row)
+    wb.save(path)
+
+
+def _generator(tmp_path, master_rows, fort_rows):
+    # Мастер файл: заголовки в 1-й строке; FORT_QR: заголовки в 7-й строке, данные с 11-й
+    master_path = tmp_path / 'master.xlsx'
+    fort_qr_path = tmp_path / 'fort_qr.xlsx'
+    _save_sheet(master_path, [MASTER_HEADER, *master_rows])
+    _save_sheet(fort_qr_path, [['title']] * 6 + [FORT_QR_HEADER] + [['service']] * 3 + fort_rows)
+    return SpecificationGenerator(master_path, fort_qr_path, tmp_path / 'template.xlsx')
+
+
+def _process(generator):
+    master_file, fort_qr = generator.load_data()
+    return generator.process_data(master_file, fort_qr)
+
+
+def _packs(gtin, sku, count, prefix):
+    return [[gtin, sku, f'Товар {prefix}', f'Item {prefix}', f'{prefix}-{n}'] for n in range(count)]
+
+
+def test_process_data_matches_buyer_sku_with_spaces_and_numbers(tmp_path):
+    generator = _generator(
+        tmp_path,
+        master_rows=[['A1', 4601, 4602, 2], [123, 4611, 4612, 2]],
+        fort_rows=[
+            *_packs(4611, 123, 2, 'num'),
+            *_packs(4601, ' A1 ', 2, 'str'),
+            # Пачки того же GTIN с чужим buyerSKU в выход не попадают
+            *_packs(4601, 'B2', 2, 'other'),
+            [4602, None, 'Коробка', 'Box', 'box-a'],
+            [4612, None, 'Коробка', 'Box', 'box-n'],
+        ],
+    )
+
+    assert _process(generator) == 4
+    output = generator.output_df
+    assert output['identificationCode'].tolist() == ['str-0', 'str-1', 'num-0', 'num-1']
+    assert output['identificationCodeOuter'].tolist() == ['box-a', 'box-a', 'box-n', 'box-n']
+
+
+def test_process_data_without_outer_codes_leaves_outer_empty(tmp_path):
+    generator = _generator(
+        tmp_path,
+        master_rows=[['A1', 4601, 4602, 2]],
+        fort_rows=_packs(4601, 'A1', 4, 'pack'),
+    )
+
+    assert _process(generator) == 4
+    output = generator.output_df
+    assert output['identificationCode'].tolist() == ['pack-0', 'pack-1', 'pack-2', 'pack-3']
+    assert output['identificationCodeOuter'].isna().all()
+
+
+def test_process_data_rejects_outer_code_shortage(tmp_path):
+    generator = _generator(
+        tmp_path,
+        master_rows=[['A1', 4601, 4602, 2]],
+        fort_rows=[*_packs(4601, 'A1', 4, 'pack'), [4602, None, 'Коробка', 'Box', 'box-0']],
+    )
+
+    with pytest.raises(ValueError, match='Не хватает кодов коробок для GTIN Outer 4602: требуется 2, найдено 1'):
+        _process(generator)
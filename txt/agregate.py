@@ -13,6 +13,8 @@
 Поддерживаемые форматы входных файлов:
     - TXT: каждая строка содержит один код маркировки
     - CSV: первый столбец содержит код маркировки (остальные столбцы игнорируются)
+      Поле в кавычках может содержать перевод строки, если кавычки встречаются уже в начале
+      файла (в образце для автоопределения); иначе незакрытая кавычка в строке - ошибка
 
 Примеры использования:
 
@@ -42,11 +44,14 @@
 """
 
 import argparse
+import codecs
 import csv
-import xml.etree.ElementTree as ET
-from datetime import datetime
+import io
+import os
+import time
+from collections.abc import Iterable, Iterator
+from itertools import chain, islice
 from pathlib import Path
-from xml.dom import minidom
 from xml.sax.saxutils import escape
 
 BASE_DIR = Path(__file__).parent
@@ -60,6 +65,37 @@ LP_TIN = "9726009063"
 # Добавьте сюда символы, которые должны остаться без экранирования
 PACK_CODE_NO_ESCAPE_CHARS = {'>',}
 
+# Таблица для str.translate: управляющие символы ASCII (0x00-0x1F) и DEL (0x7F) удаляются
+CONTROL_CHARS_TABLE = dict.fromkeys([*range(0x20), 0x7F])
+
+# То же для bytes.translate по всему TXT-файлу: удаляемые байты (все, кроме переводов строк)
+# и таблица, приводящая \r к \n
+CONTROL_BYTES = bytes(char for char in CONTROL_CHARS_TABLE if char not in (0x0A, 0x0D))
+NEWLINE_BYTES_TABLE = bytes.maketrans(b"\r", b"\n")
+
+# Автоопределение формата CSV: возможные разделители (в порядке приоритета при равенстве),
+# размер образца в символах и число его строк, по которым считаются разделители
+CSV_DELIMITERS = (",", ";", "\t")
+CSV_SAMPLE_SIZE = 4096
+CSV_SAMPLE_LINES = 20
+
+# Файлы кодов читаются блоками этого размера: в памяти держится один блок, а не весь файл
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Длина кода в XML: у pack_code - первые 25 символов кода блока, у cis - первые 21 символ КИЗ.
+# Коды обрезаются один раз при чтении (read_codes(max_len=...))
+PACK_CODE_LENGTH = 25
+CIS_CODE_LENGTH = 21
+
+# Размер буфера записи выходного файла
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# XML-декларация выходного файла
+XML_DECLARATION = b'<?xml version="1.0" encoding="utf-8"?>\n'
+
+# Экранирование значения атрибута LP_TIN (в дополнение к &, <, >), как его писал minidom
+LP_TIN_ENTITIES = {'"': "&quot;"}
+
 
 def clean_code(code: str) -> str:
     """
@@ -80,8 +116,8 @@ def clean_code(code: str) -> str:
         '0104...8005...933...'
     """
     # Удаляем все управляющие символы ASCII (0x00-0x1F), кроме пробелов (0x20)
-    # И символ DEL (0x7F)
-    return ''.join(char for char in code if ord(char) >= 0x20 and ord(char) != 0x7F)
+    # И символ DEL (0x7F) - одним str.translate по готовой таблице
+    return code.translate(CONTROL_CHARS_TABLE)
 
 
 def custom_escape(text: str, no_escape_chars: set[str] = None) -> str:
@@ -153,16 +189,88 @@ def detect_file_format(path: Path) -> str:
         raise ValueError(f"Неподдерживаемый формат файла: {suffix}. Используйте .txt или .csv")
 
 
-def read_codes(path: Path, file_format: str = None) -> list[str]:
+def _normalize_newlines(text: str) -> str:
+    """Приводит \r\n и \r к \n (\r\n, разрезанный границей блока, дает лишнюю пустую строку)."""
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def detect_csv_layout(sample: str) -> tuple[str, bool]:
     """
-    Читает коды маркировки из файла в зависимости от формата.
+    Определяет разделитель CSV и наличие строки заголовка по началу файла.
+
+    Разделитель - тот из CSV_DELIMITERS, что встречается чаще всего и примерно одинаково
+    часто в каждой строке образца (не больше двух разных количеств на строку). Заголовок
+    есть, если первое поле первой строки не начинается с цифры: код маркировки всегда
+    начинается с цифр идентификатора применения GS1, а в заголовке цифры могут быть
+    только дальше (например, "Код1").
+
+    Args:
+        sample: Начало CSV-файла.
+
+    Returns:
+        Кортеж (разделитель, есть ли строка заголовка). Если ни один разделитель
+        не найден, используется запятая.
+    """
+    # Делим только по \n (\r\n и \r приводятся к нему): splitlines() делил бы и по GS (0x1D) внутри кодов
+    lines = _normalize_newlines(sample).split("\n")
+    # Последняя строка образца может быть обрезана - не учитываем ее, если строк несколько
+    if len(sample) >= CSV_SAMPLE_SIZE and len(lines) > 1:
+        lines = lines[:-1]
+    lines = [line for line in lines[:CSV_SAMPLE_LINES] if line.strip()]
+
+    delimiter = ","
+    best_score = 0
+    for candidate in CSV_DELIMITERS:
+        counts = [line.count(candidate) for line in lines]
+        score = sum(counts)
+        if len(set(counts)) <= 2 and score > best_score:
+            delimiter, best_score = candidate, score
+
+    first_field = lines[0].split(delimiter)[0].strip().strip('"').lstrip() if lines else ""
+    has_header = bool(first_field) and not first_field[0].isdigit()
+    return delimiter, has_header
+
+
+def first_csv_field(line: str, delimiter: str) -> str:
+    """
+    Возвращает первое поле строки CSV.
+
+    Строка без кавычек в начале поля просто отрезается по первому разделителю;
+    через csv.reader разбираются только строки, где первое поле взято в кавычки
+    (в нем может быть сам разделитель).
+
+    Args:
+        line: Строка CSV-файла.
+        delimiter: Разделитель полей.
+
+    Returns:
+        Первое поле строки (без обрезки пробелов).
+
+    Raises:
+        ValueError: Если кавычка поля не закрыта до конца строки (поле с переводом строки
+                    разбирается только целиком по файлу, см. _iter_csv_codes).
+    """
+    if line.startswith('"'):
+        try:
+            return next(csv.reader([line], delimiter=delimiter, strict=True), [""])[0]
+        except csv.Error:
+            raise ValueError(f"Незакрытая кавычка в строке CSV: {line[:50]}") from None
+    return line.partition(delimiter)[0]
+
+
+def iter_codes(path: Path, file_format: str = None, max_len: int = None) -> Iterator[str]:
+    """
+    Построчно выдает коды маркировки из файла в зависимости от формата.
+
+    Наличие файла и формат проверяются сразу при вызове, коды читаются по мере перебора.
 
     Args:
         path: Путь к файлу.
         file_format: Формат файла ('txt' или 'csv'). Если None, определяется автоматически.
+        max_len: Если задан, коды обрезаются до этой длины сразу при чтении.
 
     Returns:
-        Список кодов маркировки (непустые строки).
+        Итератор кодов маркировки (непустые после очистки строки).
 
     Raises:
         FileNotFoundError: Если файл не найден.
@@ -174,40 +282,100 @@ def read_codes(path: Path, file_format: str = None) -> list[str]:
     if file_format is None:
         file_format = detect_file_format(path)
 
-    codes = []
-
     if file_format == "txt":
-        # Чтение TXT: каждая строка = один код
-        with open(path, "r", encoding="utf-8") as f:
-            codes = [clean_code(line.strip()) for line in f if line.strip()]
-
+        codes = _iter_txt_codes(path)
     elif file_format == "csv":
-        # Чтение CSV: первый столбец = код маркировки
-        with open(path, "r", encoding="utf-8", newline="") as f:
-            # Автоопределение разделителя
-            sample = f.read(1024)
-            f.seek(0)
-            sniffer = csv.Sniffer()
+        codes = _iter_csv_codes(path)
+    else:
+        codes = iter(())
+
+    if max_len is None:
+        return codes
+    return (code[:max_len] for code in codes)
+
+
+def _split_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Собирает строки из блоков текста; строка, разрезанная границей блока, склеивается."""
+    # Делим только по \n: splitlines() делил бы и по GS (0x1D) внутри кодов
+    tail = ""
+    for chunk in chunks:
+        lines = (tail + chunk).split("\n")
+        tail = lines.pop()
+        yield from lines
+    yield tail
+
+
+def _iter_txt_codes(path: Path) -> Iterator[str]:
+    """Выдает коды из TXT-файла: каждая строка = один код."""
+    # Управляющие символы удаляются из каждого блока одним bytes.translate (в UTF-8 эти байты
+    # не встречаются внутри многобайтовых символов), \r приводится к \n, как при построчном
+    # чтении. Символ, разрезанный границей блока, дособирает codecs.iterdecode
+    with open(path, "rb") as f:
+        chunks = codecs.iterdecode(
+            (chunk.translate(NEWLINE_BYTES_TABLE, CONTROL_BYTES) for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b"")),
+            "utf-8",
+        )
+        # Пустые после очистки строки (в том числе из одних управляющих символов) пропускаются
+        yield from (code for line in _split_lines(chunks) if (code := line.strip()))
 
-            try:
-                dialect = sniffer.sniff(sample, delimiters=",;\t")
-                has_header = sniffer.has_header(sample)
-            except csv.Error:
-                # Если не удалось определить, используем запятую по умолчанию
-                dialect = csv.excel
-                has_header = False
 
-            reader = csv.reader(f, dialect)
+def _iter_csv_codes(path: Path) -> Iterator[str]:
+    """Выдает коды из CSV-файла: первый столбец = код маркировки."""
+    # newline="": концы строк не переводятся, чтобы csv.reader видел переводы строк внутри кавычек
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        # Образец для автоопределения - первый прочитанный блок; он же идет в разбор строк,
+        # поэтому файл читается один раз, без перемотки
+        sample = f.read(CSV_SAMPLE_SIZE)
 
-            # Пропускаем заголовок, если он есть
-            if has_header:
-                next(reader, None)
+        # Автоопределение разделителя и заголовка по началу файла
+        delimiter, has_header = detect_csv_layout(sample)
 
-            for row in reader:
-                if row and row[0].strip():
-                    codes.append(clean_code(row[0].strip()))
+        # Поле в кавычках может содержать перевод строки: такие файлы целиком разбирает csv.reader.
+        # Образец дочитывается до конца строки - csv.reader считает каждый элемент концом записи
+        if any(line.startswith('"') for line in _normalize_newlines(sample).split("\n")):
+            yield from _iter_quoted_csv_codes(chain(io.StringIO(sample + f.readline(), newline=""), f),
+                                              delimiter, has_header)
+            return
 
-    return codes
+        rows = _split_lines(_normalize_newlines(chunk)
+                            for chunk in chain((sample,), iter(lambda: f.read(READ_CHUNK_SIZE), "")))
+
+        # Пропускаем заголовок (первую непустую строку), если он есть
+        if has_header:
+            next((line for line in rows if line.strip()), None)
+
+        yield from (code for line in rows if (code := clean_code(first_csv_field(line, delimiter).strip())))
+
+
+def _iter_quoted_csv_codes(lines: Iterable[str], delimiter: str, has_header: bool) -> Iterator[str]:
+    """Выдает коды из CSV с полями в кавычках через csv.reader (строки - с концами строк)."""
+    rows = csv.reader(lines, delimiter=delimiter)
+
+    # Пропускаем заголовок (первую непустую строку), если он есть
+    if has_header:
+        next((row for row in rows if row), None)
+
+    # Перевод строки внутри поля - управляющий символ, clean_code его удаляет
+    yield from (code for row in rows if row and (code := clean_code(row[0].strip())))
+
+
+def read_codes(path: Path, file_format: str = None, max_len: int = None) -> list[str]:
+    """
+    Читает коды маркировки из файла в зависимости от формата.
+
+    Args:
+        path: Путь к файлу.
+        file_format: Формат файла ('txt' или 'csv'). Если None, определяется автоматически.
+        max_len: Если задан, коды обрезаются до этой длины сразу при чтении.
+
+    Returns:
+        Список кодов маркировки (непустые после очистки строки).
+
+    Raises:
+        FileNotFoundError: Если файл не найден.
+        ValueError: Если формат файла не поддерживается.
+    """
+    return list(iter_codes(path, file_format, max_len))
 
 
 def read_lines(path):
@@ -224,100 +392,127 @@ def read_lines(path):
     return read_codes(Path(path))
 
 
-def create_aggregation_xml(middle_boxes, small_boxes, lp_tin):
+def get_kis_per_block(middle_count, small_count):
     """
-    Создаёт XML-структуру агрегации КИЗ.
+    Проверяет, что КИЗ распределяются по блокам поровну, и возвращает их количество на блок.
 
     Args:
-        middle_boxes: Список кодов групповых упаковок (блоков).
-        small_boxes: Список кодов индивидуальных упаковок (КИЗ).
-        lp_tin: ИНН организации.
+        middle_count: Количество кодов групповых упаковок (блоков).
+        small_count: Количество кодов индивидуальных упаковок (КИЗ).
 
     Returns:
-        Кортеж (корневой элемент XML-дерева, словарь плейсхолдер -> код КИЗ).
+        Количество КИЗ в одном блоке.
 
     Raises:
-        ValueError: Если количество КИЗ не делится нацело на количество блоков.
+        ValueError: Если файл блоков пуст или количество КИЗ не делится нацело на количество блоков.
     """
-    if len(middle_boxes) == 0:
+    if middle_count == 0:
         raise ValueError("Файл с кодами блоков пуст")
 
-    if len(small_boxes) % len(middle_boxes) != 0:
+    if small_count % middle_count != 0:
         raise ValueError(
-            f"Количество КИЗ ({len(small_boxes)}) не делится нацело "
-            f"на количество блоков ({len(middle_boxes)})"
+            f"Количество КИЗ ({small_count}) не делится нацело "
+            f"на количество блоков ({middle_count})"
         )
 
-    kis_per_block = len(small_boxes) // len(middle_boxes)
+    return small_count // middle_count
 
-    root = ET.Element("unit_pack")
-    document = ET.SubElement(root, "Document")
 
-    # Блок организации
-    organisation = ET.SubElement(document, "organisation")
-    id_info = ET.SubElement(organisation, "id_info")
-    ET.SubElement(id_info, "LP_info", LP_TIN=lp_tin)
-
-    # Содержимое упаковок
-    # Используем плейсхолдеры для pack_code и cis, чтобы ET не экранировал спецсимволы
-    cdata_map = {}
-    cis_index = 0
-    for pack_index, pack_code in enumerate(middle_boxes):
-        pack_content = ET.SubElement(document, "pack_content")
-
-        # Используем placeholder для pack_code
-        pc = ET.SubElement(pack_content, "pack_code")
-        pack_placeholder = f"__PACK_CODE_{pack_index}__"
-        pc.text = pack_placeholder
-        cdata_map[pack_placeholder] = pack_code[:25]  # Первые 25 символов
-
-        for _ in range(kis_per_block):
-            if cis_index >= len(small_boxes):
-                break
-            cis = ET.SubElement(pack_content, "cis")
-            cis_placeholder = f"__CDATA_CIS_{cis_index}__"
-            cis.text = cis_placeholder
-            cdata_map[cis_placeholder] = small_boxes[cis_index][:21]  # Первые 21 символ
-            cis_index += 1
+def write_aggregation_xml(out_fp, middle_boxes, small_boxes, lp_tin, kis_per_block=None):
+    """
+    Записывает XML агрегации КИЗ напрямую в открытый бинарный файл.
 
-    return root, cdata_map
+    Структура документа фиксирована, поэтому XML-дерево не строится: размеченные
+    фрагменты с отступами пишутся готовыми байтами вперемешку с кодами.
+    pack_code экранируется через custom_escape с PACK_CODE_NO_ESCAPE_CHARS,
+    cis записывается CDATA-секцией без экранирования.
 
+    Args:
+        out_fp: Файл, открытый на запись в бинарном режиме.
+        middle_boxes: Список кодов групповых упаковок (блоков), уже обрезанных
+                      до PACK_CODE_LENGTH символов.
+        small_boxes: Коды индивидуальных упаковок (КИЗ), уже обрезанные до CIS_CODE_LENGTH
+                     символов: список или итератор (КИЗ берутся по порядку).
+        lp_tin: ИНН организации.
+        kis_per_block: Количество КИЗ в блоке. Обязательно, если small_boxes - итератор;
+                       для списка по умолчанию считается через get_kis_per_block.
 
-def format_xml(root, cdata_map=None):
+    Raises:
+        ValueError: Если количество КИЗ не делится нацело на количество блоков, или если
+                    КИЗ в small_boxes меньше или больше, чем kis_per_block на каждый блок.
+    """
+    if kis_per_block is None:
+        kis_per_block = get_kis_per_block(len(middle_boxes), len(small_boxes))
+    w = out_fp.write
+
+    # Шапка документа и блок организации
+    w(XML_DECLARATION)
+    w(b"<unit_pack>\n"
+      b"    <Document>\n"
+      b"        <organisation>\n"
+      b"            <id_info>\n"
+      b'                <LP_info LP_TIN="')
+    w(escape(lp_tin, LP_TIN_ENTITIES).encode("utf-8"))
+    w(b'"/>\n'
+      b"            </id_info>\n"
+      b"        </organisation>\n")
+
+    # Содержимое упаковок: КИЗ берутся по порядку из одного итератора, без срезов списка
+    cis_codes = iter(small_boxes)
+    # Каждая упаковка собирается в свой bytearray и пишется в файл одним вызовом
+    for pack_code in middle_boxes:
+        pack = bytearray(b"        <pack_content>\n"
+                         b"            <pack_code>")
+        pack += custom_escape(pack_code, PACK_CODE_NO_ESCAPE_CHARS).encode("utf-8")
+        pack += b"</pack_code>\n"
+
+        # Строки cis упаковки форматируются строкой и кодируются в UTF-8 одним вызовом на упаковку,
+        # а не по отдельности для каждого КИЗ
+        cis_lines = [
+            f"            <cis><![CDATA[{cis_code}]]></cis>\n"
+            for cis_code in islice(cis_codes, kis_per_block)
+        ]
+        # Итератор мог дать меньше КИЗ, чем ожидалось (например, файл изменился после подсчета):
+        # неполный блок не пишем, а останавливаемся с ошибкой
+        if len(cis_lines) < kis_per_block:
+            raise ValueError(
+                f"Для блока {pack_code} не хватает КИЗ: "
+                f"требуется {kis_per_block}, получено {len(cis_lines)}"
+            )
+        pack += "".join(cis_lines).encode("utf-8")
+
+        pack += b"        </pack_content>\n"
+        w(pack)
+
+    if next(cis_codes, None) is not None:
+        raise ValueError("После заполнения всех блоков остались КИЗ, не попавшие ни в один блок")
+
+    w(b"    </Document>\n"
+      b"</unit_pack>\n")
+
+
+def write_aggregation_file(output_path, middle_boxes, small_boxes, lp_tin, kis_per_block=None):
     """
-    Форматирует XML-дерево в читаемый вид с отступами.
+    Записывает XML агрегации в файл: сначала во временный файл рядом, затем переименовывает.
+
+    Если запись прервалась ошибкой (например, КИЗ не хватило на последний блок), временный файл
+    удаляется, и по пути output_path не остается обрезанного XML.
 
     Args:
-        root: Корневой элемент XML-дерева.
-        cdata_map: Словарь плейсхолдер -> оригинальный код.
-                  Для __PACK_CODE_* применяется custom_escape с PACK_CODE_NO_ESCAPE_CHARS.
-                  Для __CDATA_CIS_* используется CDATA-секция без экранирования.
+        output_path: Путь к выходному XML-файлу.
+        middle_boxes, small_boxes, lp_tin, kis_per_block: Как у write_aggregation_xml.
 
-    Returns:
-        Отформатированный XML в виде байтов (UTF-8).
+    Raises:
+        ValueError: Как у write_aggregation_xml.
     """
-    rough_string = ET.tostring(root, encoding="utf-8")
-    parsed = minidom.parseString(rough_string)
-    pretty_xml = parsed.toprettyxml(indent="    ", encoding="utf-8")
-
-    # Заменяем плейсхолдеры на соответствующие значения
-    if cdata_map:
-        for placeholder, original_code in cdata_map.items():
-            if placeholder.startswith("__PACK_CODE_"):
-                # Для pack_code применяем кастомное экранирование
-                escaped_code = custom_escape(original_code, PACK_CODE_NO_ESCAPE_CHARS)
-                pretty_xml = pretty_xml.replace(
-                    placeholder.encode("utf-8"),
-                    escaped_code.encode("utf-8"),
-                )
-            elif placeholder.startswith("__CDATA_CIS_"):
-                # Для cis используем CDATA-секцию (без экранирования)
-                pretty_xml = pretty_xml.replace(
-                    placeholder.encode("utf-8"),
-                    f"<![CDATA[{original_code}]]>".encode("utf-8"),
-                )
-
-    return pretty_xml
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    try:
+        with open(tmp_path, "wb", buffering=OUTPUT_BUFFER_SIZE) as f:
+            write_aggregation_xml(f, middle_boxes, small_boxes, lp_tin, kis_per_block)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
 
 def parse_args() -> argparse.Namespace:
@@ -377,7 +572,7 @@ def generate_output_filename():
     Returns:
         Path объект с именем файла вида agregate_YYYYMMDD_HHMMSS.xml
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
     return BASE_DIR / f"agregate_{timestamp}.xml"
 
 
@@ -400,28 +595,30 @@ def main():
     # Чтение файлов с кодами (поддержка txt и csv)
     try:
         print(f"Чтение файла middle box: {middle_file}")
-        middle_boxes = read_codes(middle_file)
+        middle_boxes = read_codes(middle_file, max_len=PACK_CODE_LENGTH)
 
         print(f"Чтение файла small box: {small_file}")
-        small_boxes = read_codes(small_file)
+        # КИЗ в памяти не держим: здесь только считаем их, а в XML они пишутся вторым проходом
+        # по файлу. Число КИЗ в блоке зависит от их общего количества, поэтому без подсчета
+        # заранее блоки писать нельзя; расхождение второго прохода с подсчетом - ошибка записи
+        small_count = sum(1 for _ in iter_codes(small_file))
     except (FileNotFoundError, ValueError) as e:
         print(f"Ошибка: {e}")
         return 1
 
     # Информация о загруженных данных
     print(f"\nЗагружено блоков: {len(middle_boxes)}")
-    print(f"Загружено КИЗ: {len(small_boxes)}")
+    print(f"Загружено КИЗ: {small_count}")
     if len(middle_boxes) > 0:
-        print(f"КИЗ на блок: {len(small_boxes) // len(middle_boxes)}")
+        print(f"КИЗ на блок: {small_count // len(middle_boxes)}")
     print(f"ИНН организации: {args.inn}\n")
 
-    # Создание XML
+    # Создание XML: проверка распределения до открытия файла, чтобы при ошибке его не создавать
     try:
-        root, cdata_map = create_aggregation_xml(middle_boxes, small_boxes, args.inn)
-        pretty_xml = format_xml(root, cdata_map)
+        kis_per_block = get_kis_per_block(len(middle_boxes), small_count)
+        small_boxes = iter_codes(small_file, max_len=CIS_CODE_LENGTH)
 
-        with open(output_path, "wb") as f:
-            f.write(pretty_xml)
+        write_aggregation_file(output_path, middle_boxes, small_boxes, args.inn, kis_per_block)
 
         print(f"XML успешно создан: {output_path}")
         return 0